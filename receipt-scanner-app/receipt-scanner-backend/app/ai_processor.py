@@ -3,9 +3,10 @@ AI（OpenAI）を使用したレシート処理モジュール
 """
 
 import re
-import json
+import orjson
 import logging
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
@@ -14,6 +15,93 @@ from pydantic import BaseModel, Field
 logger = logging.getLogger(__name__)
 
 
+# YYYY-MM-DD形式の日付
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# 費目カテゴリーの判定ルール（先に書いたカテゴリーほど優先）
+EXPENSE_CATEGORY_KEYWORDS = {
+    "食費": ("スーパー", "コンビニ", "ファミリーマート", "セブンイレブン", "ローソン",
+           "イオン", "マルエツ", "レストラン", "食堂", "カフェ"),
+    "交通費": ("jr", "駅", "バス", "タクシー", "suica", "pasmo", "交通"),
+    "日用品": ("ドラッグストア", "薬局", "ダイソー", "100均", "ホームセンター"),
+    "書籍": ("書店", "本屋", "ブックオフ", "紀伊國屋"),
+    "娯楽費": ("映画", "カラオケ", "ゲーム", "アミューズメント"),
+    "医療費": ("病院", "クリニック", "薬局", "調剤"),
+    "光熱費": ("電気", "ガス", "水道", "電力", "東京電力", "東京ガス"),
+    "通信費": ("ドコモ", "au", "ソフトバンク", "携帯", "インターネット"),
+}
+
+# キーワード → (優先順位, カテゴリー)（複数のカテゴリーにあるキーワードは優先度の高い方）
+_CATEGORY_RANKS: Dict[str, Tuple[int, str]] = {
+    keyword: (rank, category)
+    for rank, (category, keywords) in reversed(list(enumerate(EXPENSE_CATEGORY_KEYWORDS.items())))
+    for keyword in keywords
+}
+
+
+def _compile_category_keywords(ranks: Dict[str, Tuple[int, str]]) -> "re.Pattern[str]":
+    """
+    全キーワードを1つの正規表現にまとめて1回の走査で探せるようにする
+    
+    先読みで全ての位置を調べる。選択は先に書いたものから試されるため、同じ位置で始まるキーワードは
+    優先順位の順（同順位なら長い順）に並べ、優先度の高いキーワードが一致するようにする。
+    """
+    keywords = sorted(ranks, key=lambda keyword: (ranks[keyword][0], -len(keyword)))
+    return re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))", re.IGNORECASE)
+
+
+_CATEGORY_KEYWORD_RE = _compile_category_keywords(_CATEGORY_RANKS)
+
+
+@lru_cache(maxsize=4096)
+def match_expense_category(text: str) -> Optional[str]:
+    """テキストに含まれるキーワードから費目カテゴリーを判定（該当する中で最も優先度の高いもの。同じ店名は再計算しない）"""
+    ranks = [_CATEGORY_RANKS[match.group(1).lower()] for match in _CATEGORY_KEYWORD_RE.finditer(text)]
+    return min(ranks)[1] if ranks else None
+
+
+def _slice_json_object(text: str) -> Optional[str]:
+    """テキスト中の最初のJSONオブジェクトを括弧の対応を数えて1回の走査で切り出す（文字列中の括弧は無視）"""
+    start = text.find('{')
+    if start < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(api_key: str, model: str) -> ChatOpenAI:
+    """ChatOpenAI（APIキーとモデルごとにプロセス内で共有し、HTTPクライアントと接続を使い回す）"""
+    return ChatOpenAI(
+        api_key=api_key,
+        model=model,
+        temperature=0,
+        max_retries=3,
+        request_timeout=30.0
+    )
+
+
 class ReceiptInfo(BaseModel):
     """レシート情報のスキーマ"""
     date: Optional[str] = Field(None, description="日付（YYYY-MM-DD形式）")
@@ -39,18 +127,14 @@ class AIProcessor:
         self.model = model
         self.llm = None
         self.parser = PydanticOutputParser(pydantic_object=ReceiptInfo)
+        # プロンプト（フォーマット指示のJSONスキーマ生成を含む）は毎回作らず使い回す
+        self._prompt_template = self.create_prompt_template()
         self._initialize_llm()
     
     def _initialize_llm(self):
         """LLMの初期化"""
         try:
-            self.llm = ChatOpenAI(
-                api_key=self.api_key,
-                model=self.model,
-                temperature=0,
-                max_retries=3,
-                request_timeout=30.0
-            )
+            self.llm = get_chat_model(self.api_key, self.model)
             logger.info(f"AI processor initialized with model: {self.model}")
         except Exception as e:
             logger.error(f"Failed to initialize AI processor: {e}")
@@ -104,11 +188,8 @@ class AIProcessor:
             }
         
         try:
-            # プロンプトの作成
-            prompt = self.create_prompt_template()
-            
             # LLMの実行
-            response = self.llm.invoke(prompt.format(text=text))
+            response = self.llm.invoke(self._prompt_template.format(text=text))
             
             # レスポンスのパース
             receipt_info = self._parse_response(response.content)
@@ -149,9 +230,9 @@ class AIProcessor:
             
             # フォールバック: JSON抽出を試みる
             try:
-                json_match = re.search(r'{.*}', response_text, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(0))
+                json_text = _slice_json_object(response_text)
+                if json_text:
+                    return orjson.loads(json_text)
             except Exception as e2:
                 logger.error(f"JSON extraction also failed: {e2}")
                 
@@ -200,7 +281,7 @@ class AIProcessor:
             return None
         
         # 既に正しい形式の場合
-        if re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
+        if _ISO_DATE_RE.match(date_str):
             return date_str
         
         # その他の形式を変換
@@ -214,33 +295,14 @@ class AIProcessor:
     
     def _suggest_category(self, data: Dict[str, Any]) -> Optional[str]:
         """店名や商品情報から費目カテゴリーを提案"""
-        store_name = data.get("store_name", "").lower()
-        
-        # カテゴリー判定ルール
-        categories = {
-            "食費": ["スーパー", "コンビニ", "ファミリーマート", "セブンイレブン", "ローソン", 
-                   "イオン", "マルエツ", "レストラン", "食堂", "カフェ"],
-            "交通費": ["jr", "駅", "バス", "タクシー", "suica", "pasmo", "交通"],
-            "日用品": ["ドラッグストア", "薬局", "ダイソー", "100均", "ホームセンター"],
-            "書籍": ["書店", "本屋", "ブックオフ", "紀伊國屋"],
-            "娯楽費": ["映画", "カラオケ", "ゲーム", "アミューズメント"],
-            "医療費": ["病院", "クリニック", "薬局", "調剤"],
-            "光熱費": ["電気", "ガス", "水道", "電力", "東京電力", "東京ガス"],
-            "通信費": ["ドコモ", "au", "ソフトバンク", "携帯", "インターネット"],
-        }
-        
-        for category, keywords in categories.items():
-            for keyword in keywords:
-                if keyword in store_name:
-                    return category
+        # 店名から判断
+        category = match_expense_category(data.get("store_name", ""))
+        if category:
+            return category
         
         # 商品情報からも判断
         if data.get("items"):
-            item_names = " ".join([item.get("name", "") for item in data["items"]]).lower()
-            for category, keywords in categories.items():
-                for keyword in keywords:
-                    if keyword in item_names:
-                        return category
+            return match_expense_category(" ".join([item.get("name", "") for item in data["items"]]))
         
         return None
     
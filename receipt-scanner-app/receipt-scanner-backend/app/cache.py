@@ -0,0 +1,42 @@
+"""
+処理結果のキャッシュ
+同じ画像・テキストの再処理を避けるため、内容のハッシュをキーに結果を再利用する
+"""
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+def content_hash(data) -> bytes:
+    """バイト列の内容ハッシュ（bytes / memoryview / mmap をコピーせずに計算）"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class LRUCache:
+    """スレッドセーフなLRUキャッシュ（呼び出し側での変更が残らないよう、値はコピーして出し入れする）"""
+    
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """キャッシュから値を取得（なければNone）"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            value = self._data[key]
+        return copy.deepcopy(value)
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """キャッシュに値を保存（上限を超えたら最も古いものを削除）"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
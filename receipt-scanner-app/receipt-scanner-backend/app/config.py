@@ -28,6 +28,19 @@ class Settings:
         # Tesseract configuration
         self.tessdata_prefix = os.getenv("TESSDATA_PREFIX")
         
+        # GPU OCR backend (EasyOCR) instead of Tesseract
+        self.use_gpu_ocr = os.getenv("USE_GPU_OCR", "false").lower() == "true"
+        
+        # Drop OCR lines whose mean word confidence (0-100) is below this value; 0 keeps every line
+        self.ocr_min_line_confidence = float(os.getenv("OCR_MIN_LINE_CONFIDENCE", "0"))
+        
+        # Worker processes for image processing (each holds its own ReceiptProcessor); 0 = one per CPU
+        self.process_pool_workers = int(os.getenv("PROCESS_POOL_WORKERS", "0")) or os.cpu_count() or 1
+        if self.use_gpu_ocr and self.process_pool_workers > 1:
+            # Each worker would load its own EasyOCR model into GPU memory; keep a single GPU worker
+            logging.info("USE_GPU_OCR is set; limiting image processing to a single worker process")
+            self.process_pool_workers = 1
+        
         # CORS configuration
         allowed_origins_str = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
         
@@ -1,4 +1,5 @@
 import os
+import orjson
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -13,14 +14,25 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./receipts.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+def _json_serializer(obj) -> str:
+    """Serialize JSON columns with orjson (the engine expects str, not bytes)"""
+    return orjson.dumps(obj).decode()
+
+# JSON columns (e.g. Receipt.items) are encoded/decoded with orjson instead of the json module
+json_options = {
+    "json_serializer": _json_serializer,
+    "json_deserializer": orjson.loads,
+}
+
 # Create engine with appropriate settings
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False}  # Needed for SQLite
+        connect_args={"check_same_thread": False},  # Needed for SQLite
+        **json_options
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **json_options)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -71,7 +71,7 @@ class Receipt(Base):
         return {
             "id": self.id,
             "store_name": self.store_name,
-            "purchase_date": self.purchase_date.isoformat() if self.purchase_date else None,
+            "purchase_date": self.purchase_date,
             "total_amount": self.total_amount,
             "category": self.category,
             "items": self.items,
@@ -81,7 +81,7 @@ class Receipt(Base):
             "confidence_score": self.confidence_score,
             "image_path": self.image_path,
             "image_url": self.image_url,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "uploaded_at": self.uploaded_at.isoformat() if self.uploaded_at else None
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "uploaded_at": self.uploaded_at
         }
\ No newline at end of file
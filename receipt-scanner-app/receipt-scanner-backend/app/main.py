@@ -1,24 +1,33 @@
 import logging
 import time
-from functools import wraps
-from typing import Dict, Any, List, Optional
+from functools import wraps, cache
+from typing import Dict, Any, List, Optional, Tuple
 import io
 import csv
 import os
+import asyncio
+import multiprocessing
 import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi.responses import ORJSONResponse, Response, FileResponse
 from fastapi.security import HTTPBearer
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 import psycopg
 
 from app.config import settings
 from app.models import ReceiptData, ReceiptResponse, ReceiptList
-from app.receipt_processor import ReceiptProcessor
+from app.receipt_processor import (
+    detect_image_format, IMAGE_SNIFF_BYTES, PROCESSING_MODES, init_worker,
+    process_image_in_worker, process_images_in_worker, get_capabilities_in_worker
+)
 from app.database import get_db, engine, Base
 from app.db_models import Receipt as ReceiptDB, User
 from app.auth import get_current_active_user, get_current_active_user_optional
@@ -36,7 +45,8 @@ app = FastAPI(
     title="Receipt Scanner API",
     description="Secure receipt scanning and processing API with AI-OCR hybrid and Vision API support",
     version="2.2.0",
-    debug=settings.debug
+    debug=settings.debug,
+    default_response_class=ORJSONResponse
 )
 
 # Include authentication routes
@@ -53,12 +63,11 @@ development_origins = [
 ]
 
 # Configure CORS with secure settings
-allowed_origins = settings.allowed_origins.copy()
-if settings.is_development:
-    allowed_origins.extend(development_origins)
-
-# 重複を削除
-allowed_origins = list(set(allowed_origins))
+# 重複を削除（設定順を維持）
+allowed_origins = tuple(dict.fromkeys([
+    *settings.allowed_origins,
+    *(development_origins if settings.is_development else ()),
+]))
 
 logger.info(f"CORS allowed origins: {allowed_origins}")
 
@@ -72,9 +81,29 @@ app.add_middleware(
 )
 
 # Initialize components
-receipt_processor = ReceiptProcessor()
 security = HTTPBearer(auto_error=False)
 
+# CPU-bound image processing runs in worker processes so it doesn't block the event loop.
+# Workers are spawned (not forked) and each builds its own ReceiptProcessor; the API
+# process does not build one (PROCESS_POOL_WORKERS bounds how many copies exist).
+process_pool = ProcessPoolExecutor(
+    max_workers=settings.process_pool_workers,
+    mp_context=multiprocessing.get_context("spawn"),
+    initializer=init_worker
+)
+
+async def _process_in_pool(image, processing_mode: Optional[str]) -> Dict[str, Any]:
+    """Run process_image on the process pool (image is bytes or a file path)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool, process_image_in_worker, image, processing_mode)
+
+# Processing capabilities as reported by a worker's processor; filled in once by startup_event
+processing_capabilities: Dict[str, Any] = {}
+
+def _caps() -> Dict[str, Any]:
+    """Processing capabilities (fixed once the worker processors are initialized)."""
+    return processing_capabilities
+
 # Create receipts_images directory for storing uploaded images
 UPLOAD_DIR = Path("receipts_images")
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -154,7 +183,7 @@ async def log_requests(request: Request, call_next):
 @app.get("/")
 async def root():
     """Root endpoint."""
-    capabilities = receipt_processor.get_processing_capabilities()
+    capabilities = _caps()
     
     return {
         "message": "Receipt Scanner API",
@@ -165,6 +194,7 @@ async def root():
             "health": "/healthz",
             "api_status": "/api/status",
             "upload": "/api/receipts/upload",
+            "batch_upload": "/api/receipts/batch",
             "receipts": "/api/receipts",
             "capabilities": "/api/capabilities"
         }
@@ -175,16 +205,16 @@ async def health_check():
     """Health check endpoint."""
     return {
         "status": "ok",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "environment": settings.environment,
         "openai_available": settings.openai_available,
         "cors_origins": allowed_origins[:3] if len(allowed_origins) > 3 else allowed_origins,
     }
 
-@app.get("/api/status")
-async def api_status():
-    """API status endpoint with service information."""
-    capabilities = receipt_processor.get_processing_capabilities()
+@cache
+def _api_status_body() -> Dict[str, Any]:
+    """Build the /api/status response body once; nothing in it changes at runtime."""
+    capabilities = _caps()
     
     return {
         "api_version": "2.1.0",
@@ -203,17 +233,71 @@ async def api_status():
         "recommended_mode": capabilities["recommended_mode"],
         "limits": {
             "max_requests_per_minute": settings.rate_limit_requests,
-            "max_file_size_mb": 50
+            "max_file_size_mb": 50,
+            "max_batch_files": MAX_BATCH_FILES
         },
         "cors_enabled": True,
         "allowed_origins_count": len(allowed_origins),
         "supported_formats": [".jpg", ".jpeg", ".png", ".heic", ".heif", ".webp", ".bmp", ".tiff", ".tif"]
     }
 
+@app.get("/api/status")
+async def api_status():
+    """API status endpoint with service information."""
+    return _api_status_body()
+
 @app.get("/api/capabilities")
 async def get_capabilities():
     """Get detailed processing capabilities."""
-    return receipt_processor.get_processing_capabilities()
+    return _caps()
+
+async def _write_temp_upload(file: UploadFile) -> Tuple[Path, int]:
+    """Copy an upload to a temp file in UPLOAD_DIR; returns (path, size)."""
+    await file.seek(0)
+    tmp_file = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=".part", delete=False)
+    tmp_path = Path(tmp_file.name)
+    with tmp_file:
+        await run_in_threadpool(shutil.copyfileobj, file.file, tmp_file)
+        file_size = tmp_file.tell()
+    return tmp_path, file_size
+
+def _save_receipt(db: Session, result: Dict[str, Any], filename: str, tmp_path: Path,
+                  processing_mode: Optional[str], current_user: User) -> None:
+    """Insert a processed receipt and move its temp file into place; updates result["data"]."""
+    receipt_data = result["data"]
+    
+    # Decide the image path up front so it can be part of the INSERT
+    image_filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
+    image_path = UPLOAD_DIR / image_filename
+    
+    # Insert and fetch generated columns in a single round-trip (no refresh)
+    stmt = insert(ReceiptDB).values(
+        store_name=receipt_data.get("store_name", "Unknown"),
+        purchase_date=receipt_data.get("date", datetime.utcnow()),
+        total_amount=receipt_data.get("total_amount", 0.0),
+        category=receipt_data.get("expense_category"),
+        items=receipt_data.get("items"),
+        payment_method=receipt_data.get("payment_method"),
+        tax_amount=receipt_data.get("tax_amount"),
+        processing_mode=result.get("processing_mode", processing_mode or "auto"),
+        confidence_score=result.get("confidence_score"),
+        ocr_text=result.get("ocr_text"),
+        image_path=str(image_path),
+        user_id=current_user.id
+    ).returning(ReceiptDB.id, ReceiptDB.created_at)
+    row = db.execute(stmt).one()
+    db.commit()
+    
+    # Move the temp file into place only after the row is committed so a failed
+    # insert leaves no orphan file (atomic rename, no copy)
+    os.replace(tmp_path, image_path)
+    
+    # Update result with database ID
+    receipt_data["id"] = row.id
+    receipt_data["created_at"] = row.created_at
+    receipt_data["image_path"] = str(image_path)
+    
+    logger.info(f"Successfully processed and saved receipt {row.id}")
 
 @app.post("/api/receipts/upload", response_model=ReceiptResponse)
 @rate_limit()
@@ -239,8 +323,8 @@ async def upload_receipt(
     logger.info(f"File info: name={file.filename}, content_type={file.content_type}")
     
     # Validate processing mode
-    if processing_mode and processing_mode not in ["ai", "ocr", "vision", "auto"]:
-        return JSONResponse(
+    if processing_mode and processing_mode not in PROCESSING_MODES:
+        return ORJSONResponse(
             status_code=400,
             content={
                 "success": False,
@@ -252,7 +336,7 @@ async def upload_receipt(
     # Validate file
     if not file.filename:
         logger.warning("No filename provided")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={
                 "success": False,
@@ -285,7 +369,7 @@ async def upload_receipt(
     
     if file_ext and file_ext not in allowed_extensions and not content_type_valid:
         logger.warning(f"Unsupported file - extension: {file_ext}, content_type: {file.content_type}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={
                 "success": False,
@@ -299,75 +383,55 @@ async def upload_receipt(
             }
         )
     
-    # ファイルサイズチェック
-    content = await file.read()
-    logger.info(f"File content size: {len(content)} bytes")
+    # マジックナンバーで画像かどうかを判定（本体を読み込む前に弾く）
+    header = await file.read(IMAGE_SNIFF_BYTES)
     
-    if len(content) > 50 * 1024 * 1024:
-        logger.warning(f"File too large: {len(content)} bytes")
-        return JSONResponse(
+    if not header:
+        logger.warning("Empty file uploaded")
+        return ORJSONResponse(
             status_code=400,
             content={
                 "success": False,
-                "message": "ファイルサイズが大きすぎます。50MB以下のファイルをアップロードしてください。",
+                "message": "空のファイルがアップロードされました。",
                 "data": None
             }
         )
     
-    if len(content) == 0:
-        logger.warning("Empty file uploaded")
-        return JSONResponse(
+    if detect_image_format(header) is None:
+        logger.warning(f"Unrecognized image signature - extension: {file_ext}, content_type: {file.content_type}")
+        return ORJSONResponse(
             status_code=400,
             content={
                 "success": False,
-                "message": "空のファイルがアップロードされました。",
+                "message": "画像ファイルとして認識できません。対応している画像形式をアップロードしてください。",
                 "data": None
             }
         )
     
+    # アップロードを一時ファイルへ書き出す（本体をbytesとしてメモリに複製しない）
+    tmp_path, file_size = await _write_temp_upload(file)
+    logger.info(f"File content size: {file_size} bytes")
+    
     try:
-        # Process the image
+        # ファイルサイズチェック
+        if file_size > 50 * 1024 * 1024:
+            logger.warning(f"File too large: {file_size} bytes")
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": "ファイルサイズが大きすぎます。50MB以下のファイルをアップロードしてください。",
+                    "data": None
+                }
+            )
+        
+        # Process the image off the event loop (the worker mmaps the temp file)
         logger.info("Starting image processing...")
-        result = receipt_processor.process_image(content, processing_mode=processing_mode)
+        result = await _process_in_pool(str(tmp_path), processing_mode)
         logger.info(f"Processing result: {result['success']}")
         
         if result["success"]:
-            receipt_data = result["data"]
-            
-            # Create database record
-            db_receipt = ReceiptDB(
-                store_name=receipt_data.get("store_name", "Unknown"),
-                purchase_date=receipt_data.get("date", datetime.utcnow()),
-                total_amount=receipt_data.get("total_amount", 0.0),
-                category=receipt_data.get("expense_category"),
-                items=receipt_data.get("items"),
-                payment_method=receipt_data.get("payment_method"),
-                tax_amount=receipt_data.get("tax_amount"),
-                processing_mode=result.get("processing_mode", processing_mode or "auto"),
-                confidence_score=result.get("confidence_score"),
-                ocr_text=result.get("ocr_text"),
-                user_id=current_user.id
-            )
-            
-            # Save image file
-            if content:
-                image_filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-                image_path = UPLOAD_DIR / image_filename
-                with open(image_path, "wb") as f:
-                    f.write(content)
-                db_receipt.image_path = str(image_path)
-            
-            # Save to database
-            db.add(db_receipt)
-            db.commit()
-            db.refresh(db_receipt)
-            
-            # Update result with database ID
-            receipt_data["id"] = db_receipt.id
-            receipt_data["created_at"] = db_receipt.created_at.isoformat() if db_receipt.created_at else None
-            receipt_data["image_path"] = db_receipt.image_path
-            
-            logger.info(f"Successfully processed and saved receipt {db_receipt.id}")
+            _save_receipt(db, result, file.filename, tmp_path, processing_mode, current_user)
         else:
             logger.warning(f"Processing failed: {result['message']}")
         
@@ -375,7 +439,123 @@ async def upload_receipt(
         
     except Exception as e:
         logger.error(f"Error processing receipt: {e}", exc_info=True)
-        return JSONResponse(
+        return ORJSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": "画像処理中にサーバーエラーが発生しました。",
+                "data": None,
+                "error_details": str(e) if settings.debug else None
+            }
+        )
+    finally:
+        # 保存されなかった一時ファイルを削除
+        tmp_path.unlink(missing_ok=True)
+
+# Maximum number of images accepted by the batch upload endpoint
+MAX_BATCH_FILES = 20
+
+@app.post("/api/receipts/batch", response_model=Dict[str, Any])
+@rate_limit()
+async def upload_receipts_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    processing_mode: Optional[str] = Query(None, description="Processing mode: 'ai', 'ocr', 'vision', or 'auto'"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user_optional)
+):
+    """
+    Upload and process several receipt images at once.
+    
+    OCR runs in one worker through a single Tesseract session, and results are
+    returned in upload order. Each successful receipt is saved like /upload.
+    """
+    logger.info(f"Batch upload request from: {request.client.host} ({len(files)} files)")
+    
+    if processing_mode and processing_mode not in PROCESSING_MODES:
+        return ORJSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "message": "無効な処理モードです。'ai', 'ocr', 'vision', または 'auto' を指定してください。",
+                "data": None
+            }
+        )
+    
+    if len(files) > MAX_BATCH_FILES:
+        return ORJSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "message": f"一度にアップロードできるのは{MAX_BATCH_FILES}件までです。",
+                "data": None
+            }
+        )
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(files)
+    staged = []  # (index, file, temp path)
+    
+    try:
+        # 画像として認識できるファイルだけを一時ファイルに書き出す
+        for i, file in enumerate(files):
+            header = await file.read(IMAGE_SNIFF_BYTES)
+            if not header or detect_image_format(header) is None:
+                results[i] = {
+                    "success": False,
+                    "message": "画像ファイルとして認識できません。対応している画像形式をアップロードしてください。",
+                    "data": None
+                }
+                continue
+            
+            tmp_path, file_size = await _write_temp_upload(file)
+            if file_size > 50 * 1024 * 1024:
+                tmp_path.unlink(missing_ok=True)
+                results[i] = {
+                    "success": False,
+                    "message": "ファイルサイズが大きすぎます。50MB以下のファイルをアップロードしてください。",
+                    "data": None
+                }
+                continue
+            staged.append((i, file, tmp_path))
+        
+        if staged:
+            # Split the images evenly across the pool so every worker takes a share of the batch
+            paths = [str(path) for _, _, path in staged]
+            chunk_size = -(-len(paths) // settings.process_pool_workers)
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(
+                    process_pool, process_images_in_worker, paths[start:start + chunk_size], processing_mode
+                )
+                for start in range(0, len(paths), chunk_size)
+            ))
+            outcomes = [result for chunk in chunks for result in chunk]
+            for (i, file, tmp_path), result in zip(staged, outcomes):
+                if result["success"]:
+                    # A failed save only fails this receipt; the others are still saved and reported
+                    try:
+                        _save_receipt(db, result, file.filename, tmp_path, processing_mode, current_user)
+                    except Exception as e:
+                        db.rollback()
+                        logger.error("Error saving receipt %s from batch: %s", file.filename, e, exc_info=True)
+                        result = {
+                            "success": False,
+                            "message": "レシートの保存中にエラーが発生しました。",
+                            "data": None,
+                            "error_details": str(e) if settings.debug else None
+                        }
+                results[i] = result
+        
+        processed = sum(1 for result in results if result["success"])
+        return {
+            "success": processed > 0,
+            "message": f"{len(files)}件中{processed}件のレシートを処理しました。",
+            "results": results
+        }
+        
+    except Exception as e:
+        logger.error(f"Error processing receipt batch: {e}", exc_info=True)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -384,6 +564,10 @@ async def upload_receipt(
                 "error_details": str(e) if settings.debug else None
             }
         )
+    finally:
+        # 保存されなかった一時ファイルを削除
+        for _, _, tmp_path in staged:
+            tmp_path.unlink(missing_ok=True)
 
 @app.post("/api/receipts/analyze", response_model=Dict[str, Any])
 @rate_limit()
@@ -403,30 +587,31 @@ async def analyze_receipt(
     
     try:
         # Get detailed analysis
-        capabilities = receipt_processor.get_processing_capabilities()
+        capabilities = _caps()
         
-        # Process with all available methods
-        results = {}
+        # Process with all available methods (in parallel on the process pool)
+        modes = {}
         
         # OCR analysis
         if capabilities["capabilities"]["ocr"]:
-            ocr_result = receipt_processor.process_image(content, processing_mode="ocr")
-            results["ocr"] = ocr_result
+            modes["ocr"] = "ocr"
         
         # AI analysis
         if capabilities["capabilities"]["ai"]:
-            ai_result = receipt_processor.process_image(content, processing_mode="ai")
-            results["ai"] = ai_result
+            modes["ai"] = "ai"
         
         # Vision API analysis
         if capabilities["capabilities"]["vision"]:
-            vision_result = receipt_processor.process_image(content, processing_mode="vision")
-            results["vision"] = vision_result
+            modes["vision"] = "vision"
         
         # Hybrid analysis
         if "ai-ocr-hybrid" in capabilities["available_modes"]:
-            hybrid_result = receipt_processor.process_image(content, processing_mode="auto")
-            results["hybrid"] = hybrid_result
+            modes["hybrid"] = "auto"
+        
+        outcomes = await asyncio.gather(*(
+            _process_in_pool(content, mode) for mode in modes.values()
+        ))
+        results = dict(zip(modes, outcomes))
         
         return {
             "success": True,
@@ -438,7 +623,7 @@ async def analyze_receipt(
         
     except Exception as e:
         logger.error(f"Error analyzing receipt: {e}", exc_info=True)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -674,20 +859,18 @@ async def export_receipts_csv(
             }
             writer.writerow(row)
         
-        # Generate CSV content
-        csv_content = output.getvalue()
+        # Encode once (with BOM so Excel detects UTF-8)
+        csv_bytes = ("\ufeff" + output.getvalue()).encode("utf-8")
         
         # Generate filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"receipt_data_{timestamp}.csv"
         
-        # Return as streaming response
-        return StreamingResponse(
-            io.StringIO(csv_content),
-            media_type="text/csv",
+        return Response(
+            content=csv_bytes,
+            media_type="text/csv; charset=utf-8",
             headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Type": "text/csv; charset=utf-8-sig"
+                "Content-Disposition": f"attachment; filename={filename}"
             }
         )
         
@@ -807,7 +990,7 @@ async def get_receipt_image(
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Custom HTTP exception handler."""
     logger.warning(f"HTTP Exception: {exc.status_code} - {exc.detail}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
@@ -820,7 +1003,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """General exception handler for unhandled errors."""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -836,7 +1019,10 @@ async def startup_event():
     """Application startup event."""
     logger.info(f"Receipt Scanner API v2.1.0 starting up in {settings.environment} mode")
     
-    capabilities = receipt_processor.get_processing_capabilities()
+    # Ask a worker without blocking the event loop (the first call spawns it and builds its processor)
+    loop = asyncio.get_running_loop()
+    processing_capabilities.update(await loop.run_in_executor(process_pool, get_capabilities_in_worker))
+    capabilities = _caps()
     logger.info(f"Processing mode: {capabilities['processing_mode']}")
     logger.info(f"Available modes: {capabilities['available_modes']}")
     logger.info(f"Capabilities: {capabilities['capabilities']}")
@@ -849,3 +1035,4 @@ async def startup_event():
 async def shutdown_event():
     """Application shutdown event."""
     logger.info("Receipt Scanner API shutting down")
+    process_pool.shutdown(cancel_futures=True)
@@ -3,17 +3,227 @@ OCR専用の処理モジュール
 AI-OCR機能と通常のOCR処理を分離して、より明確な構造にする
 """
 
+import os
 import re
 import logging
-from typing import Dict, Any, Optional, List, Tuple
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, Callable
 from datetime import datetime
 import cv2
 import numpy as np
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import Image, ImageFilter
 import pytesseract
 
+from app.cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# 複数のTesseractを並列に起動するため、各プロセスはシングルスレッドにして
+# CPUコアの奪い合い（OpenMPのオーバーサブスクリプション）を防ぐ
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# tesserocr（Tesseractのプロセス内API）のインポートを条件付きに
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    logging.warning("tesserocr not available. OCR will spawn a tesseract process per call via pytesseract.")
+
+# RE2（線形時間の正規表現エンジン）のインポートを条件付きに
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+    logging.warning("google-re2 not available. Falling back to the standard re module for receipt text extraction.")
+
+# EasyOCR（GPUでの一括推論）のインポートを条件付きに
+try:
+    import easyocr
+    EASYOCR_AVAILABLE = True
+except ImportError:
+    EASYOCR_AVAILABLE = False
+    logging.info("easyocr not available. GPU OCR backend is disabled.")
+
+# 全角数字 → 半角の変換テーブル（カンマは商品名にも現れるため変換しない）
+FULLWIDTH_TABLE = str.maketrans('０１２３４５６７８９', '0123456789')
+
+# 数字（半角・全角）
+_DIGIT_RE = re.compile(r'\d')
+
+# 金額の文字列から区切り（半角・全角カンマ、スペース）を除くテーブル
+AMOUNT_SEPARATORS_TABLE = str.maketrans('', '', ',， ')
+
+def _digit_mask(text: str) -> np.ndarray:
+    """文字ごとに数字（半角・全角）かどうかを表す配列"""
+    codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    return ((codepoints >= 0x30) & (codepoints <= 0x39)) | ((codepoints >= 0xFF10) & (codepoints <= 0xFF19))
+
+
+def digit_ratio(text: str) -> float:
+    """文字列中の数字（半角・全角）の割合をnumpyでまとめて計算"""
+    if not text:
+        return 0.0
+    return float(np.count_nonzero(_digit_mask(text))) / len(text)
+
+
+def line_digit_ratios(lines: List[str]) -> np.ndarray:
+    """複数行の数字の割合を1回の走査で計算（各行は空でないこと）"""
+    if not lines:
+        return np.empty(0)
+    # 行を連結して数字の累積数を取り、各行末での差分から行ごとの数字数を求める
+    digit_cumsum = np.cumsum(_digit_mask(''.join(lines)))
+    lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    ends = np.cumsum(lengths) - 1
+    per_line_digits = np.diff(digit_cumsum[ends], prepend=0)
+    return per_line_digits / lengths
+
+
+def _parse_reiwa(groups: List[str], current_year: int) -> Tuple[int, int, int]:
+    """令和n年m月d日"""
+    return 2018 + int(groups[0]), int(groups[1]), int(groups[2])
+
+
+def _parse_heisei(groups: List[str], current_year: int) -> Tuple[int, int, int]:
+    """平成n年m月d日"""
+    return 1988 + int(groups[0]), int(groups[1]), int(groups[2])
+
+
+def _parse_md(groups: List[str], current_year: int) -> Tuple[int, int, int]:
+    """MM/DD形式（年は現在の年で補完）"""
+    return current_year, int(groups[0]), int(groups[1])
+
+
+def _parse_ymd(groups: List[str], current_year: int) -> Tuple[int, int, int]:
+    """年月日形式（2桁の年は50未満を2000年代、それ以外を1900年代とみなす）"""
+    year = int(groups[0])
+    if year < 100:
+        year += 2000 if year < 50 else 1900
+    return year, int(groups[1]), int(groups[2])
+
+
+def _is_total_pattern(pattern: str) -> bool:
+    """金額パターンが「合計」系（合計・TOTAL）かどうか"""
+    return '合' in pattern or 'TOTAL' in pattern.upper()
+
+
+def _tax_kind(pattern: str) -> Optional[str]:
+    """税額パターンの種類（'excluded'＝税抜、'included'＝税込、それ以外はNone）"""
+    if '税抜' in pattern or '税別' in pattern:
+        return 'excluded'
+    if '税込' in pattern:
+        return 'included'
+    return None
+
+
+# 無名キャプチャグループの開き括弧
+_CAPTURE_GROUP = re.compile(r'(?<!\\)\((?!\?)')
+
+
+def _fuse_patterns(prefix: str, patterns: List[str], flags: int = 0,
+                   keep: Optional[Callable[[str], bool]] = None) -> Tuple[Any, Dict[str, int]]:
+    """
+    複数パターンを名前付きグループの単一の選択パターンに結合
+    
+    i番目のパターンのj番目のグループは "{prefix}{i}_{j}" という名前になる。
+    keepを指定した場合、keepが偽のパターンは除外する（番号は元のまま）。
+    戻り値: (結合済みパターン, 各パターンの最後のグループ名 → パターン番号)
+    """
+    parts = []
+    last_groups = {}
+    for i, pattern in enumerate(patterns):
+        if keep is not None and not keep(pattern):
+            continue
+        group_count = re.compile(pattern).groups
+        group_numbers = iter(range(group_count))
+        parts.append(_CAPTURE_GROUP.sub(lambda _: f'(?P<{prefix}{i}_{next(group_numbers)}>', pattern))
+        last_groups[f'{prefix}{i}_{group_count - 1}'] = i
+    return _compile_fused('|'.join(parts), flags), last_groups
+
+
+# 文字クラス（[...]、否定の[^...]を含む）
+_CHAR_CLASS = re.compile(r'\[(\^?)([^\]]*)\]')
+
+
+def _can_match_ascii(pattern: str) -> bool:
+    """
+    パターンがASCIIのみのテキストに一致し得るか（保守的な判定）
+    
+    グループの外に「合」「円」など全角の文字（またはASCIIを含まない文字クラス）が
+    省略不可で現れるパターンはASCIIテキストには一致しない。グループの中や選択（|）は判定しない。
+    """
+    # 文字クラスを1文字に置き換える（ASCIIを含む・否定のクラスは'x'、それ以外は全角空白）
+    reduced = _CHAR_CLASS.sub(
+        lambda m: 'x' if m.group(1) or any(c.isascii() for c in m.group(2)) else '\u3000', pattern
+    )
+    depth = 0
+    i = 0
+    while i < len(reduced):
+        c = reduced[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0:
+            if c == '|':
+                return True
+            optional = i + 1 < len(reduced) and reduced[i + 1] in '?*{'
+            if not c.isascii() and not optional:
+                return False
+        i += 1
+    return True
+
+
+def _compile_fused(pattern: str, flags: int = 0):
+    """結合済みパターンをコンパイル（RE2があればRE2、なければre）"""
+    if not RE2_AVAILABLE:
+        return re.compile(pattern, flags)
+    
+    # RE2はフラグをインラインで指定し、\sはASCII空白のみなので全角スペースを追加する
+    inline_flags = ('i' if flags & re.IGNORECASE else '') + ('m' if flags & re.MULTILINE else '')
+    re2_pattern = pattern.replace(r'\s', r'[\s\x{3000}]')
+    if inline_flags:
+        re2_pattern = f'(?{inline_flags}){re2_pattern}'
+    try:
+        return re2.compile(re2_pattern)
+    except Exception as e:
+        logger.warning("RE2 compilation failed, using re instead: %s", e)
+        return re.compile(pattern, flags)
+
+
+class GPUOCRBackend:
+    """EasyOCRによるGPU一括推論バックエンド（画像を固定サイズにそろえてバッチで認識）"""
+    
+    # バッチサイズと推論時の画像サイズ（形状を固定してcuDNNの自動チューニングを再利用する）
+    BATCH_SIZE = 16
+    N_WIDTH = 1200
+    N_HEIGHT = 800
+    
+    def __init__(self, langs: Tuple[str, ...] = ('ja', 'en')):
+        self.reader = easyocr.Reader(list(langs), gpu=True, cudnn_benchmark=True)
+        # 同じ形状のダミーバッチでウォームアップ（初回推論のカーネル選択をここで済ませる）
+        dummy = np.zeros((self.BATCH_SIZE, self.N_HEIGHT, self.N_WIDTH), dtype=np.uint8)
+        self.reader.readtext_batched(list(dummy), n_width=self.N_WIDTH, n_height=self.N_HEIGHT, detail=0)
+        logger.info("GPU OCR backend initialized (languages: %s)", ', '.join(langs))
+    
+    def readtext_batch(self, images: List[Image.Image]) -> List[str]:
+        """複数画像をバッチ単位でGPU推論し、画像ごとのテキストを返す"""
+        texts: List[str] = []
+        for start in range(0, len(images), self.BATCH_SIZE):
+            chunk = [np.asarray(image) for image in images[start:start + self.BATCH_SIZE]]
+            results = self.reader.readtext_batched(
+                chunk, n_width=self.N_WIDTH, n_height=self.N_HEIGHT, detail=0
+            )
+            texts.extend("\n".join(lines) for lines in results)
+        return texts
+
 
 class OCRProcessor:
     """OCR専用の処理クラス"""
@@ -100,53 +310,167 @@ class OCRProcessor:
         r'([^\d\n]{2,})\s+(\d{1,3}(?:[,，]\d{3})*)\s*円',
     ]
     
-    def __init__(self, cv2_available: bool = True):
+    # 事前コンパイル済みパターン（クラス読み込み時に一度だけコンパイル）
+    # 日付: (パターン, 年月日への変換関数) の表。変換関数はパターンの種類ごとに読み込み時に決める
+    # 日付はパターンの定義順に各パターンの最初の一致を試すため結合しない（結合すると、電話番号などに
+    # 一致する後方の柔軟なパターンが先に文字を消費し、優先度の高いパターンの一致が見つからなくなる）
+    _DATE_TABLE = tuple(
+        (compiled,
+         _parse_reiwa if '令和' in compiled.pattern
+         else _parse_heisei if '平成' in compiled.pattern
+         else _parse_md if compiled.groups == 2
+         else _parse_ymd)
+        for compiled in map(re.compile, DATE_PATTERNS)
+    )
+    
+    # 金額: 「合計」系（優先、パターンの定義順に試して最初の妥当な一致で確定）とそれ以外（合計がない場合のみ走査）に分ける
+    # 金額のパターン同士は一致が重なる（例: 「12345円」の「345円」と「12345」）ため結合せず、
+    # パターンごとにコンパイルして個別に走査する
+    _TOTAL_AMOUNT_PATTERNS = tuple(p for p in AMOUNT_PATTERNS if _is_total_pattern(p))
+    _OTHER_AMOUNT_PATTERNS = tuple(p for p in AMOUNT_PATTERNS if not _is_total_pattern(p))
+    _TOTAL_AMOUNT_RES = tuple(_compile_fused(p, re.IGNORECASE | re.MULTILINE) for p in _TOTAL_AMOUNT_PATTERNS)
+    _OTHER_AMOUNT_RES = tuple(_compile_fused(p, re.IGNORECASE | re.MULTILINE) for p in _OTHER_AMOUNT_PATTERNS)
+    # ASCIIのみのテキスト用（全角の文字が必須のパターンを除外）
+    _ASCII_TOTAL_AMOUNT_RES = tuple(
+        compiled for p, compiled in zip(_TOTAL_AMOUNT_PATTERNS, _TOTAL_AMOUNT_RES) if _can_match_ascii(p)
+    )
+    _ASCII_OTHER_AMOUNT_RES = tuple(
+        compiled for p, compiled in zip(_OTHER_AMOUNT_PATTERNS, _OTHER_AMOUNT_RES) if _can_match_ascii(p)
+    )
+    
+    # 税額: 結果に使わない種類（内税・消費税・外税）のパターンは結合しない
+    _TAX_RE, _TAX_GROUPS = _fuse_patterns('tax', TAX_PATTERNS, keep=_tax_kind)
+    _TAX_KINDS = tuple(map(_tax_kind, TAX_PATTERNS))
+    
+    # 商品: 同じ行が両方のパターンに一致するため、金額と同じくパターンごとに走査する
+    _ITEM_RES = tuple(_compile_fused(p) for p in ITEM_PATTERNS)
+    
+    # Tesseractの設定 (OEM, PSM)
+    OCR_CONFIGS = (
+        (3, 6),   # デフォルト設定
+        (1, 3),   # LSTM only, 自動ページ分割
+        (3, 4),   # 単一列のテキスト
+        (3, 11),  # スパーステキスト
+    )
+    
+    # Tesseractの変数（前処理で白地に黒の二値画像にしているため、文字の白黒反転を試す処理は不要）
+    TESS_VARIABLES = {'tessedit_do_invert': '0'}
+    
+    # 設定選択用の縮小画像（この幅を超える画像を1/3に縮小して評価）
+    THUMBNAIL_MIN_WIDTH = 1000
+    THUMBNAIL_SCALE = 3
+    
+    # 前処理後の画像の長辺の上限（px）。これより大きい画像は縮小してからOCRする
+    PREPROCESS_MAX_EDGE = 2000
+    
+    # 一括OCRで1回のtesseract起動に渡す最大画像数（pytesseractのパイプ詰まり対策）
+    BATCH_CHUNK_SIZE = 400
+    
+    # _preprocess_basicのシャープネス強調用カーネル（2×恒等 − SMOOTHフィルタ）
+    _SHARPEN_KERNEL = ImageFilter.Kernel((3, 3), (-1, -1, -1, -1, 21, -1, -1, -1, -1), scale=13)
+    
+    # 店名を探す先頭行数と、店名から除去する記号類
+    STORE_NAME_MAX_LINES = 10
+    _STORE_NAME_STRIP_RE = re.compile(r'[^\w\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]')
+    
+    # レシートとして処理する最小文字数（日本語は1文字あたりの情報量が多いため小さめ）
+    MIN_TEXT_LENGTH = 10
+    
+    # テキスト抽出結果のキャッシュ件数
+    TEXT_CACHE_SIZE = 256
+    
+    def __init__(self, cv2_available: bool = True, use_gpu: bool = False, min_line_confidence: float = 0):
         self.cv2_available = cv2_available
-        
-    def preprocess_image(self, image: Image.Image, advanced: bool = True) -> Image.Image:
-        """画像の前処理"""
+        # OCR結果に残す行の最小信頼度（行内の単語の平均、0〜100）。0なら全ての行を残す
+        self.min_line_confidence = min_line_confidence
+        # GPU OCRバックエンド（有効化されていて、EasyOCRが使える場合のみ）
+        self._gpu_backend: Optional[GPUOCRBackend] = None
+        if use_gpu:
+            if EASYOCR_AVAILABLE:
+                try:
+                    self._gpu_backend = GPUOCRBackend()
+                except Exception as e:
+                    logger.warning("GPU OCR backend initialization failed, using Tesseract: %s", e)
+            else:
+                logger.warning("GPU OCR was requested but easyocr is not installed, using Tesseract")
+        # Tesseractの認識処理はGILを解放する（pytesseractの場合は別プロセス）ため、スレッドで並列に実行できる
+        self._ocr_executor = ThreadPoolExecutor(max_workers=len(self.OCR_CONFIGS))
+        # tesserocrのAPIハンドルのプール: (言語, OEM, PSM) → 空いているAPIのリスト
+        # APIはスレッドセーフではないため1スレッドずつ貸し出し、同時に使われている数だけ生成する（モデルの読み込みは生成時のみ）
+        self._tess_idle: Dict[Tuple[str, int, int], List[Any]] = {}
+        self._tess_all: List[Any] = []
+        self._tess_apis_lock = threading.Lock()
+        # 前処理の中間画像用バッファとCLAHEオブジェクト（スレッドごとに保持。結果の画像には使わない）
+        self._scratch_buffers = threading.local()
+        # process_receipt_textの結果キャッシュ（テキストをキーにする）
+        self._text_cache = LRUCache(maxsize=self.TEXT_CACHE_SIZE)
+        
+    def preprocess_image(self, image: Image.Image, advanced: bool = True, quality: str = 'fast') -> Image.Image:
+        """
+        画像の前処理
+        
+        Args:
+            image: 入力画像
+            advanced: OpenCVによる高度な前処理を使うか
+            quality: 'fast'（メディアンフィルタ）または 'max'（Non-Local Meansでノイズ除去、低速）
+        """
         if advanced and self.cv2_available:
-            return self._preprocess_advanced(image)
+            return self._preprocess_advanced(image, quality=quality)
         else:
             return self._preprocess_basic(image)
     
-    def _preprocess_advanced(self, image: Image.Image) -> Image.Image:
+    def _preprocess_advanced(self, image: Image.Image, quality: str = 'fast') -> Image.Image:
         """OpenCVを使用した高度な前処理"""
         try:
-            # PIL ImageをOpenCV形式に変換
-            img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            # グレースケール変換（PIL Imageのバッファから直接、BGRを経由しない）
+            # 途中のグレースケール・ノイズ除去画像は使い回しのバッファに書き込む
+            shape = (image.size[1], image.size[0])
+            if image.mode == 'L':
+                gray = np.asarray(image)
+            else:
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY, dst=self._scratch('gray', shape))
             
-            # グレースケール変換
-            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+            # リサイズ（大きすぎる場合。以降の処理とOCRを縮小後の画素数で済ませる）
+            new_size = self._limited_size(image.size)
+            if new_size != image.size:
+                shape = (new_size[1], new_size[0])
+                gray = cv2.resize(gray, new_size, dst=self._scratch('resized', shape), interpolation=cv2.INTER_AREA)
             
-            # ノイズ除去
-            denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+            # ノイズ除去（二値化前提なのでメディアンフィルタで十分。NLMは quality='max' の場合のみ）
+            if quality == 'max':
+                denoised = cv2.fastNlMeansDenoising(gray, self._scratch('denoised', shape), 10, 7, 21)
+            else:
+                denoised = cv2.medianBlur(gray, 3, dst=self._scratch('denoised', shape))
             
             # コントラスト調整（CLAHE）
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(denoised)
-            
-            # 二値化（大津の手法）
-            _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            enhanced = self._clahe().apply(denoised)
             
-            # モルフォロジー変換でノイズを除去
-            kernel = np.ones((1,1), np.uint8)
-            cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+            # 二値化（大津の手法）: 新しい画像を確保せずenhancedを上書き
+            _, cleaned = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=enhanced)
             
-            # 傾き補正
-            coords = np.column_stack(np.where(cleaned > 0))
-            if len(coords) > 0:
-                angle = cv2.minAreaRect(coords)[-1]
-                if angle < -45:
-                    angle = 90 + angle
+            # 傾き補正（4画素おきに間引いた文字（黒）画素の最小外接矩形から角度を推定）
+            points = cv2.findNonZero(cv2.bitwise_not(cleaned[::4, ::4]))
+            if points is not None and len(points) > 100:
+                angle = cv2.minAreaRect(points)[-1]
+                # 角度の範囲はOpenCVのバージョンによって[-90, 0)または(0, 90]なので[-45, 45]に正規化
+                if angle > 45:
+                    angle -= 90
+                elif angle < -45:
+                    angle += 90
                 
-                # 回転補正
-                (h, w) = cleaned.shape[:2]
-                center = (w // 2, h // 2)
-                M = cv2.getRotationMatrix2D(center, angle, 1.0)
-                rotated = cv2.warpAffine(cleaned, M, (w, h), 
-                                       flags=cv2.INTER_CUBIC, 
-                                       borderMode=cv2.BORDER_REPLICATE)
+                # 回転補正（ほぼ傾いていない場合は省略、小さな角度なら双線形補間で十分）
+                if abs(angle) < 0.5:
+                    rotated = cleaned
+                else:
+                    (h, w) = cleaned.shape[:2]
+                    center = (w // 2, h // 2)
+                    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+                    interpolation = cv2.INTER_LINEAR if abs(angle) < 5 else cv2.INTER_CUBIC
+                    rotated = cv2.warpAffine(cleaned, M, (w, h), 
+                                           flags=interpolation, 
+                                           borderMode=cv2.BORDER_REPLICATE)
             else:
                 rotated = cleaned
             
@@ -157,99 +481,308 @@ class OCRProcessor:
             return result_image
             
         except Exception as e:
-            logger.warning(f"Advanced preprocessing failed: {e}")
+            logger.warning("Advanced preprocessing failed: %s", e)
             return self._preprocess_basic(image)
     
+    def _clahe(self) -> Any:
+        """CLAHEオブジェクト（スレッドごとに一度だけ作って使い回す）"""
+        clahe = getattr(self._scratch_buffers, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            self._scratch_buffers.clahe = clahe
+        return clahe
+    
+    def _limited_size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """前処理後の画像サイズ（長辺がPREPROCESS_MAX_EDGEを超える場合は縦横比を保って縮小）"""
+        width, height = size
+        if width > self.PREPROCESS_MAX_EDGE or height > self.PREPROCESS_MAX_EDGE:
+            ratio = min(self.PREPROCESS_MAX_EDGE / width, self.PREPROCESS_MAX_EDGE / height)
+            return int(width * ratio), int(height * ratio)
+        return size
+    
+    def _scratch(self, name: str, shape: Tuple[int, int]) -> np.ndarray:
+        """前処理の中間画像用バッファ（スレッドごと。同じ大きさなら前回の領域を再利用）"""
+        buffer = getattr(self._scratch_buffers, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            setattr(self._scratch_buffers, name, buffer)
+        return buffer
+    
     def _preprocess_basic(self, image: Image.Image) -> Image.Image:
         """基本的な画像前処理"""
-        # RGBに変換
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # グレースケール変換（RGB以外はRGBを経由）
+        if image.mode != 'L':
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image = image.convert('L')
         
-        # グレースケール変換
-        image = image.convert('L')
+        # リサイズ（大きすぎる場合。以降のフィルタを縮小後の画素数で済ませるため先に行う）
+        new_size = self._limited_size(image.size)
+        if new_size != image.size:
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
         
-        # コントラスト強調
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(2.0)
+        # コントラスト強調（ImageEnhance.Contrast(2.0)と同じく平均輝度を中心に2倍: 256要素のLUTで1パス）
+        histogram = image.histogram()
+        mean = int(sum(i * count for i, count in enumerate(histogram)) / max(sum(histogram), 1) + 0.5)
+        image = image.point([min(255, max(0, int(mean + (v - mean) * 2.0))) for v in range(256)])
         
-        # シャープネス強調
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(2.0)
-        
-        # リサイズ（大きすぎる場合）
-        width, height = image.size
-        if width > 2000 or height > 2000:
-            ratio = min(2000/width, 2000/height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # シャープネス強調（ImageEnhance.Sharpness(2.0) = 2×原画像 − SMOOTH を1回の畳み込みで）
+        image = image.filter(self._SHARPEN_KERNEL)
         
         return image
     
     def extract_text(self, image: Image.Image, lang: str = 'jpn+eng') -> str:
-        """OCRでテキストを抽出"""
-        # Tesseractの設定を最適化
-        custom_configs = [
-            r'--oem 3 --psm 6',  # デフォルト設定
-            r'--oem 1 --psm 3',  # LSTM only, 自動ページ分割
-            r'--oem 3 --psm 4',  # 単一列のテキスト
-            r'--oem 3 --psm 11', # スパーステキスト
+        """OCRでテキストを抽出（縮小画像で設定を選び、原寸画像のOCRは1回のみ）"""
+        if self._gpu_backend:
+            return self._gpu_backend.readtext_batch([image])[0]
+        
+        oem, psm = self._select_config(image, lang)
+        try:
+            return self._ocr_with_config(image, lang, oem, psm)
+        except Exception as e:
+            logger.warning("OCR failed with config --oem %s --psm %s: %s", oem, psm, e)
+            return ""
+    
+    def _select_config(self, image: Image.Image, lang: str) -> Tuple[int, int]:
+        """縮小画像で各設定の平均信頼度を並列に計算し、最も高い設定を返す"""
+        width, height = image.size
+        if width > self.THUMBNAIL_MIN_WIDTH:
+            thumbnail = image.resize((width // self.THUMBNAIL_SCALE, height // self.THUMBNAIL_SCALE))
+        else:
+            thumbnail = image
+        
+        futures = [
+            self._ocr_executor.submit(self._score_config, thumbnail, lang, oem, psm)
+            for oem, psm in self.OCR_CONFIGS
         ]
         
-        best_text = ""
-        max_length = 0
+        best_config = self.OCR_CONFIGS[0]
+        best_score = -1.0
         
-        for config in custom_configs:
+        # 設定順に結果を確認（同じ信頼度なら先の設定を優先）
+        for (oem, psm), future in zip(self.OCR_CONFIGS, futures):
             try:
-                text = pytesseract.image_to_string(image, lang=lang, config=config)
-                if len(text) > max_length:
-                    max_length = len(text)
-                    best_text = text
-                    logger.debug(f"Better OCR result with config: {config}, length: {len(text)}")
+                score = future.result()
+                if score > best_score:
+                    best_score = score
+                    best_config = (oem, psm)
+                    logger.debug("Better OCR config: --oem %d --psm %d, confidence: %.1f", oem, psm, score)
             except Exception as e:
-                logger.warning(f"OCR failed with config {config}: {e}")
+                logger.warning("OCR scoring failed with config --oem %s --psm %s: %s", oem, psm, e)
                 continue
         
-        return best_text
+        return best_config
+    
+    def _score_config(self, image: Image.Image, lang: str, oem: int, psm: int) -> float:
+        """指定した設定でOCRを実行し、単語の平均信頼度（0〜100）を返す"""
+        if TESSEROCR_AVAILABLE:
+            try:
+                api = self._acquire_tess_api(lang, oem, psm)
+            except Exception as e:
+                logger.warning("tesserocr initialization failed (lang=%s, oem=%s, psm=%s): %s", lang, oem, psm, e)
+            else:
+                try:
+                    api.SetImage(image)
+                    return float(api.MeanTextConf())
+                finally:
+                    self._release_tess_api(lang, oem, psm, api)
+        
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=self._tess_config(oem, psm), output_type=pytesseract.Output.DICT
+        )
+        confidences = [float(conf) for conf in data["conf"] if float(conf) >= 0]
+        return sum(confidences) / len(confidences) if confidences else 0.0
+    
+    def extract_text_batch(self, images: List[Image.Image], lang: str = 'jpn+eng') -> List[str]:
+        """
+        複数画像のテキストをまとめて抽出
+        
+        tesserocrがあればプールから借りた1つのAPIハンドルを使い回して順に処理する。
+        なければ画像を一時ディレクトリに保存し、ファイルリストを渡して1回のtesseract起動で処理する。
+        （どちらも起動と言語データの読み込みを画像ごとに繰り返さない）
+        GPUバックエンドが有効な場合はEasyOCRでバッチ推論する。
+        """
+        if self._gpu_backend:
+            return self._gpu_backend.readtext_batch(images)
+        
+        oem, psm = self.OCR_CONFIGS[0]
+        if TESSEROCR_AVAILABLE:
+            try:
+                api = self._acquire_tess_api(lang, oem, psm)
+            except Exception as e:
+                logger.warning("tesserocr initialization failed (lang=%s, oem=%s, psm=%s): %s", lang, oem, psm, e)
+            else:
+                try:
+                    texts = []
+                    for image in images:
+                        api.SetImage(image)
+                        texts.append(self._page_text(api))
+                    return texts
+                finally:
+                    self._release_tess_api(lang, oem, psm, api)
+        
+        texts: List[str] = []
+        
+        for start in range(0, len(images), self.BATCH_CHUNK_SIZE):
+            chunk = images[start:start + self.BATCH_CHUNK_SIZE]
+            with tempfile.TemporaryDirectory() as temp_dir:
+                paths = [os.path.join(temp_dir, f"{i}.png") for i in range(len(chunk))]
+                for image, path in zip(chunk, paths):
+                    image.save(path)
+                list_path = os.path.join(temp_dir, "list.txt")
+                with open(list_path, "w") as f:
+                    f.write("\n".join(paths))
+                
+                if self.min_line_confidence > 0:
+                    data = pytesseract.image_to_data(
+                        list_path, lang=lang, config=self._tess_config(oem, psm), output_type=pytesseract.Output.DICT
+                    )
+                else:
+                    output = pytesseract.image_to_string(list_path, lang=lang, config=self._tess_config(oem, psm))
+            
+            if self.min_line_confidence > 0:
+                # 各画像は1ページとして出力される（page_numは1から）
+                texts.extend(self._confident_page_texts(data, len(chunk)))
+            else:
+                # 各ページのテキストは改ページ（\f）で区切られる
+                pages = output.split("\x0c")
+                texts.extend(pages[:len(chunk)])
+                texts.extend([""] * (len(chunk) - len(pages)))
+        
+        return texts
+    
+    def process_batch(self, images: List[Image.Image], lang: str = 'jpn+eng') -> List[Dict[str, Any]]:
+        """複数のレシート画像を前処理・一括OCRして情報を抽出"""
+        processed_images = [self.preprocess_image(image) for image in images]
+        texts = self.extract_text_batch(processed_images, lang=lang)
+        return [self.process_receipt_text(text) for text in texts]
+    
+    def _ocr_with_config(self, image: Image.Image, lang: str, oem: int, psm: int) -> str:
+        """指定した設定でOCRを実行（tesserocrがあればプロセス内で、なければpytesseractで）"""
+        if TESSEROCR_AVAILABLE:
+            try:
+                api = self._acquire_tess_api(lang, oem, psm)
+            except Exception as e:
+                logger.warning("tesserocr initialization failed (lang=%s, oem=%s, psm=%s): %s", lang, oem, psm, e)
+            else:
+                # 貸し出されたAPIはこのスレッドだけが使う（同時のOCRは別のAPIで並列に実行される）
+                try:
+                    api.SetImage(image)
+                    return self._page_text(api)
+                finally:
+                    self._release_tess_api(lang, oem, psm, api)
+        
+        if self.min_line_confidence > 0:
+            data = pytesseract.image_to_data(
+                image, lang=lang, config=self._tess_config(oem, psm), output_type=pytesseract.Output.DICT
+            )
+            return self._confident_page_texts(data, 1)[0]
+        return pytesseract.image_to_string(image, lang=lang, config=self._tess_config(oem, psm))
+    
+    def _page_text(self, api) -> str:
+        """SetImage済みのtesserocr APIからテキストを取得（min_line_confidenceが設定されていれば行を選別）"""
+        if self.min_line_confidence <= 0:
+            return api.GetUTF8Text()
+        
+        api.Recognize()
+        lines = []
+        for line in tesserocr.iterate_level(api.GetIterator(), tesserocr.RIL.TEXTLINE):
+            text = line.GetUTF8Text(tesserocr.RIL.TEXTLINE).strip()
+            if text:
+                lines.append((text, line.Confidence(tesserocr.RIL.TEXTLINE)))
+        return self._select_confident_lines(lines)
+    
+    def _confident_page_texts(self, data: Dict[str, List], page_count: int) -> List[str]:
+        """image_to_dataの単語単位の結果を行にまとめ、ページごとに信頼度の高い行を選別して連結"""
+        lines: Dict[Tuple[int, int, int, int], List[Tuple[str, float]]] = {}
+        for page, block, par, line, word, conf in zip(
+            data['page_num'], data['block_num'], data['par_num'], data['line_num'], data['text'], data['conf']
+        ):
+            if word.strip():
+                lines.setdefault((page, block, par, line), []).append((word, float(conf)))
+        
+        # 辞書は挿入順（読み取り順）を保つ
+        pages: List[List[Tuple[str, float]]] = [[] for _ in range(page_count)]
+        for (page, _, _, _), words in lines.items():
+            if 1 <= page <= page_count:
+                confidence = sum(conf for _, conf in words) / len(words)
+                pages[page - 1].append((' '.join(word for word, _ in words), confidence))
+        return [self._select_confident_lines(page_lines) for page_lines in pages]
+    
+    def _select_confident_lines(self, lines: List[Tuple[str, float]]) -> str:
+        """
+        (行のテキスト, 信頼度) のリストから信頼度がmin_line_confidence以上の行だけを連結
+        
+        行を落とすと合計金額の抽出結果が変わる場合（かすれた合計行など）は、全ての行をそのまま使う。
+        """
+        full_text = '\n'.join(text for text, _ in lines)
+        confident_text = '\n'.join(text for text, confidence in lines if confidence >= self.min_line_confidence)
+        if self.extract_amount(confident_text) != self.extract_amount(full_text):
+            return full_text
+        return confident_text
+    
+    def preload(self, lang: str = 'jpn+eng') -> None:
+        """全設定のtesserocr APIを事前に生成（言語データの読み込みを最初のリクエストから外す）"""
+        if not TESSEROCR_AVAILABLE or self._gpu_backend:
+            return
+        for oem, psm in self.OCR_CONFIGS:
+            try:
+                self._release_tess_api(lang, oem, psm, self._acquire_tess_api(lang, oem, psm))
+            except Exception as e:
+                logger.warning("tesserocr preload failed (lang=%s, oem=%s, psm=%s): %s", lang, oem, psm, e)
+        logger.info("Preloaded %d Tesseract API handle(s)", len(self._tess_all))
+    
+    def close(self) -> None:
+        """tesserocr APIとスレッドプールを解放"""
+        self._ocr_executor.shutdown(wait=False)
+        with self._tess_apis_lock:
+            for api in self._tess_all:
+                api.End()
+            self._tess_all.clear()
+            self._tess_idle.clear()
+    
+    def _tess_config(self, oem: int, psm: int) -> str:
+        """pytesseractに渡す設定文字列（OEM・PSMとTESS_VARIABLES）"""
+        variables = ''.join(f' -c {name}={value}' for name, value in self.TESS_VARIABLES.items())
+        return f'--oem {oem} --psm {psm}{variables}'
+    
+    def _acquire_tess_api(self, lang: str, oem: int, psm: int) -> Any:
+        """設定に対応するtesserocr APIをプールから借りる（空きがなければ生成。使い終わったら_release_tess_apiで返す）"""
+        with self._tess_apis_lock:
+            idle = self._tess_idle.get((lang, oem, psm))
+            if idle:
+                return idle.pop()
+        
+        # 言語データの読み込みは時間がかかるため、ロックの外で生成する
+        api = tesserocr.PyTessBaseAPI(lang=lang, oem=oem, psm=psm)
+        for name, value in self.TESS_VARIABLES.items():
+            api.SetVariable(name, value)
+        with self._tess_apis_lock:
+            self._tess_all.append(api)
+        return api
+    
+    def _release_tess_api(self, lang: str, oem: int, psm: int, api: Any) -> None:
+        """借りたtesserocr APIをプールに返す"""
+        with self._tess_apis_lock:
+            self._tess_idle.setdefault((lang, oem, psm), []).append(api)
     
     def extract_date(self, text: str) -> Optional[str]:
         """テキストから日付を抽出"""
         current_year = datetime.now().year
         
-        for pattern in self.DATE_PATTERNS:
-            matches = re.search(pattern, text)
+        for pattern, parse in self._DATE_TABLE:
+            matches = pattern.search(text)
             if matches:
                 try:
-                    groups = matches.groups()
-                    groups = [g.strip() if isinstance(g, str) else g for g in groups]
-                    
-                    if "令和" in pattern:
-                        year = 2018 + int(groups[0])
-                        month = int(groups[1])
-                        day = int(groups[2])
-                    elif "平成" in pattern:
-                        year = 1988 + int(groups[0])
-                        month = int(groups[1])
-                        day = int(groups[2])
-                    elif len(groups) == 2:  # MM/DD形式
-                        year = current_year
-                        month = int(groups[0])
-                        day = int(groups[1])
-                    else:
-                        year = int(groups[0])
-                        month = int(groups[1])
-                        day = int(groups[2])
-                        
-                        if year < 100:
-                            year += 2000 if year < 50 else 1900
+                    groups = [g.strip() if isinstance(g, str) else g for g in matches.groups()]
+                    year, month, day = parse(groups, current_year)
                     
                     # 妥当性チェック
                     if 1 <= month <= 12 and 1 <= day <= 31:
                         date_obj = datetime(year, month, day)
                         return date_obj.strftime("%Y-%m-%d")
                 except (ValueError, IndexError) as e:
-                    logger.debug(f"Date extraction failed for pattern {pattern}: {e}")
+                    logger.debug("Date extraction failed for pattern %s: %s", pattern.pattern, e)
                     continue
         
         return None
@@ -258,17 +791,16 @@ class OCRProcessor:
         """テキストから店名を抽出"""
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         
-        # 最初の数行から店名を探す
-        for i in range(min(10, len(lines))):
-            line = lines[i]
-            if line and len(line) > 1 and len(line) < 50:
+        # 最初の数行から店名を探す（各行の数字の割合はまとめて計算）
+        candidates = lines[:self.STORE_NAME_MAX_LINES]
+        for line, ratio in zip(candidates, line_digit_ratios(candidates)):
+            if 1 < len(line) < 50:
                 # 数字の割合が30%未満の行を店名候補とする
-                digit_count = sum(1 for char in line if char.isdigit())
-                if len(line) > 0 and digit_count / len(line) < 0.3:
+                if ratio < 0.3:
                     # OCRアーティファクトを除去
-                    cleaned = re.sub(r'[^\w\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]', '', line)
+                    cleaned = self._STORE_NAME_STRIP_RE.sub('', line)
                     if cleaned and len(cleaned) > 1:
-                        logger.debug(f"Store name candidate: {cleaned}")
+                        logger.debug("Store name candidate: %s", cleaned)
                         return cleaned
         
         # フォールバック：最初の空でない行
@@ -278,118 +810,145 @@ class OCRProcessor:
         
         return None
     
-    def extract_amount(self, text: str) -> Optional[float]:
+    def extract_amount(self, text: str, normalized: bool = False) -> Optional[float]:
         """テキストから金額を抽出"""
-        amounts_found = []
+        # 全角数字を半角に変換（正規化済みの場合はそのまま）
+        normalized_text = text if normalized else text.translate(FULLWIDTH_TABLE)
         
-        # 全角数字を半角に変換
-        normalized_text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+        # ASCIIのみのテキストでは全角の文字が必須のパターンを試さない
+        if normalized_text.isascii():
+            total_res, other_res = self._ASCII_TOTAL_AMOUNT_RES, self._ASCII_OTHER_AMOUNT_RES
+        else:
+            total_res, other_res = self._TOTAL_AMOUNT_RES, self._OTHER_AMOUNT_RES
+        
+        # 「合計」パターンを優先順（定義順）に試し、最初の妥当な金額で確定
+        # （テキスト中の位置ではなくパターンの順で決める。例: 「合計」は「TOTAL」より優先）
+        for total_re in total_res:
+            for match in total_re.finditer(normalized_text):
+                amount = self._parse_amount(match.group(1))
+                if amount is not None:
+                    logger.debug("Amount found: %s (pattern: %s)", amount, total_re.pattern)
+                    return amount
         
-        for pattern in self.AMOUNT_PATTERNS:
-            matches = re.findall(pattern, normalized_text, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                try:
-                    if isinstance(match, tuple):
-                        amount_str = match[0]
-                    else:
-                        amount_str = match
-                    
-                    # カンマ、全角カンマ、スペースを削除
-                    amount_str = amount_str.replace(',', '').replace('，', '').replace(' ', '')
-                    amount = float(amount_str)
-                    
-                    # 妥当な金額範囲かチェック（1円〜1000万円）
-                    if 1 <= amount <= 10000000:
-                        amounts_found.append((amount, pattern))
-                        logger.debug(f"Amount found: {amount} (pattern: {pattern})")
-                except (ValueError, IndexError):
-                    continue
+        # 合計が見つからない場合のみ、それ以外のパターンから最大値を返す
+        amounts = array('d')
+        for other_re in other_res:
+            for match in other_re.finditer(normalized_text):
+                amount = self._parse_amount(match.group(1))
+                if amount is not None:
+                    amounts.append(amount)
+                    logger.debug("Amount found: %s (pattern: %s)", amount, other_re.pattern)
         
-        # 最も妥当な金額を選択
-        if amounts_found:
-            # 「合計」パターンを優先
-            for amount, pattern in amounts_found:
-                if '合' in pattern or 'TOTAL' in pattern.upper():
-                    return amount
-            
-            # それ以外は最大値を返す
-            return max(amounts_found, key=lambda x: x[0])[0]
+        if amounts:
+            return max(amounts)
         
         return None
     
-    def extract_tax_amounts(self, text: str) -> Tuple[Optional[float], Optional[float]]:
+    @staticmethod
+    def _parse_amount(amount_str: str) -> Optional[float]:
+        """金額文字列を数値に変換（妥当な金額範囲: 1円〜1000万円、範囲外はNone）"""
+        try:
+            # カンマ、スペースを削除
+            amount = float(amount_str.translate(AMOUNT_SEPARATORS_TABLE))
+        except ValueError:
+            return None
+        return amount if 1 <= amount <= 10000000 else None
+    
+    def extract_tax_amounts(self, text: str, normalized: bool = False) -> Tuple[Optional[float], Optional[float]]:
         """テキストから税額を抽出"""
         tax_excluded = None
         tax_included = None
         
-        normalized_text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+        # 税額パターンはすべて「税」を含むので、含まないテキストは走査しない
+        if '税' not in text:
+            return tax_excluded, tax_included
         
-        for pattern in self.TAX_PATTERNS:
-            matches = re.findall(pattern, normalized_text)
-            for match in matches:
-                try:
-                    if isinstance(match, tuple):
-                        if len(match) >= 2:
-                            tax_type = match[0]
-                            amount_str = match[1]
-                        else:
-                            amount_str = match[0]
-                            tax_type = ""
-                    else:
-                        amount_str = match
-                        tax_type = ""
-                    
-                    amount_str = amount_str.replace(',', '').replace('，', '').replace(' ', '')
-                    amount = float(amount_str)
-                    
-                    if "税抜" in tax_type or "税別" in tax_type:
-                        tax_excluded = amount
-                    elif "税込" in tax_type:
-                        tax_included = amount
-                except (ValueError, IndexError):
-                    continue
+        normalized_text = text if normalized else text.translate(FULLWIDTH_TABLE)
+        
+        for match in self._TAX_RE.finditer(normalized_text):
+            try:
+                tax_kind = self._TAX_KINDS[self._TAX_GROUPS[match.lastgroup]]
+                
+                amount_str = match.group(match.lastgroup)
+                amount_str = amount_str.translate(AMOUNT_SEPARATORS_TABLE)
+                amount = float(amount_str)
+                
+                if tax_kind == 'excluded':
+                    tax_excluded = amount
+                elif tax_kind == 'included':
+                    tax_included = amount
+            except (ValueError, KeyError):
+                continue
         
         return tax_excluded, tax_included
     
-    def extract_items(self, text: str) -> List[Dict[str, Any]]:
+    def extract_items(self, text: str, normalized: bool = False) -> List[Dict[str, Any]]:
         """テキストから商品情報を抽出"""
-        items = []
-        normalized_text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
-        
-        for pattern in self.ITEM_PATTERNS:
-            matches = re.findall(pattern, normalized_text)
-            for match in matches:
+        names, prices = self._extract_item_columns(text, normalized)
+        return self._materialize_items(names, prices)
+    
+    def _extract_item_columns(self, text: str, normalized: bool = False) -> Tuple[List[str], array]:
+        """テキストから商品名と価格を列ごとに抽出"""
+        names: List[str] = []
+        prices = array('d')
+        normalized_text = text if normalized else text.translate(FULLWIDTH_TABLE)
+        
+        for item_re in self._ITEM_RES:
+            for match in item_re.finditer(normalized_text):
                 try:
-                    if isinstance(match, tuple) and len(match) >= 2:
-                        item_name = match[0].strip()
-                        price_str = match[1].replace(',', '').replace('，', '').replace(' ', '')
-                        price = float(price_str)
-                        
-                        if len(item_name) > 1 and 1 <= price <= 100000:
-                            items.append({
-                                "name": item_name,
-                                "price": price
-                            })
-                except (ValueError, IndexError):
+                    item_name = match.group(1).strip()
+                    price = float(match.group(2).translate(AMOUNT_SEPARATORS_TABLE))
+                    
+                    if len(item_name) > 1 and 1 <= price <= 100000:
+                        names.append(item_name)
+                        prices.append(price)
+                except ValueError:
                     continue
         
-        return items
+        return names, prices
+    
+    @staticmethod
+    def _materialize_items(names: List[str], prices: array) -> List[Dict[str, Any]]:
+        """商品名・価格の列からAPI用の辞書リストを生成"""
+        return [{"name": name, "price": price} for name, price in zip(names, prices)]
     
     def process_receipt_text(self, text: str) -> Dict[str, Any]:
+        """OCRテキストから情報を抽出（同じテキストの結果はキャッシュから返す）"""
+        cached = self._text_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        result = self._process_receipt_text(text)
+        self._text_cache.set(text, result)
+        return result
+    
+    def _process_receipt_text(self, text: str) -> Dict[str, Any]:
         """OCRテキストから情報を抽出"""
-        if not text.strip():
+        stripped = text.strip()
+        if not stripped:
             return {
                 "success": False,
                 "message": "OCRでテキストを抽出できませんでした。",
                 "data": None
             }
         
+        # 短すぎる・数字を含まないテキストはレシートとして読み取れていないため、抽出処理を省略
+        if len(stripped) < self.MIN_TEXT_LENGTH or not _DIGIT_RE.search(stripped):
+            return {
+                "success": False,
+                "message": "OCRで読み取れたテキストが不十分です。画像の品質を確認してください。",
+                "data": None
+            }
+        
         # 各種情報を抽出
+        # 金額系の抽出用に全角数字を一度だけ正規化
+        normalized_text = text.translate(FULLWIDTH_TABLE)
+        
         date_str = self.extract_date(text)
         store_name = self.extract_store_name(text)
-        total_amount = self.extract_amount(text)
-        tax_excluded, tax_included = self.extract_tax_amounts(text)
-        items = self.extract_items(text)
+        total_amount = self.extract_amount(normalized_text, normalized=True)
+        tax_excluded, tax_included = self.extract_tax_amounts(normalized_text, normalized=True)
+        item_names, item_prices = self._extract_item_columns(normalized_text, normalized=True)
         
         # 抽出できなかった項目を記録
         missing_fields = []
@@ -418,7 +977,7 @@ class OCRProcessor:
                 "total_amount": total_amount,
                 "tax_excluded_amount": tax_excluded,
                 "tax_included_amount": tax_included,
-                "items": items if items else None,
+                "items": self._materialize_items(item_names, item_prices) if item_names else None,
                 "expense_category": None,
                 "ocr_confidence": self._calculate_confidence(text, store_name, total_amount, date_str)
             }
@@ -444,8 +1003,8 @@ class OCRProcessor:
             confidence += 0.1
         
         # テキストの品質評価（数字と文字のバランス）
-        digit_ratio = sum(1 for c in text if c.isdigit()) / len(text) if text else 0
-        if 0.1 < digit_ratio < 0.5:
+        text_digit_ratio = digit_ratio(text)
+        if 0.1 < text_digit_ratio < 0.5:
             confidence += 0.1
         
         return min(confidence, 1.0)
@@ -1,21 +1,32 @@
 import os
 import io
+import re
+import time
+import mmap
+import orjson
 import logging
 import platform
-import subprocess
-import base64
-from datetime import datetime
-from PIL import Image, ImageFilter, ImageEnhance
-from typing import Dict, Any, Optional, Tuple
+import shutil
+import struct
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from enum import Enum
+from functools import lru_cache
+from itertools import repeat
+from PIL import Image
+from typing import Dict, Any, Optional, Tuple, Union, List, Callable
 from openai import OpenAI
 
-# HEIFのインポートを条件付きに
+# HEIFのインポートを条件付きに（PillowのプラグインとしてImage.openでHEIC/HEIFを直接開けるようにする）
 try:
-    import pyheif
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
     HEIF_AVAILABLE = True
 except ImportError:
     HEIF_AVAILABLE = False
-    logging.warning("pyheif not available. HEIC/HEIF image support will be disabled.")
+    logging.warning("pillow-heif not available. HEIC/HEIF image support will be disabled.")
 
 # OpenCVのインポートを条件付きに
 try:
@@ -33,62 +44,270 @@ from openai import OpenAI
 
 from app.config import settings
 from app.ocr_processor import OCRProcessor
-from app.ai_processor import AIProcessor
+from app.ai_processor import AIProcessor, match_expense_category
+from app.cache import LRUCache, content_hash
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+# OSごとのTesseractのインストール先候補（PATHに見つからない場合に確認）
+TESSERACT_CANDIDATE_PATHS = {
+    "Windows": (
+        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+        r"C:\tesseract\tesseract.exe",
+    ),
+    "Darwin": (
+        "/usr/local/bin/tesseract",
+        "/opt/homebrew/bin/tesseract",
+        "/usr/bin/tesseract",
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def find_tesseract() -> Optional[str]:
+    """Tesseractの実行ファイルのパスを探す（TESSERACT_CMD → PATH → OSごとの候補。プロセスを起動しない）"""
+    override = os.environ.get("TESSERACT_CMD")
+    if override:
+        return override if os.path.exists(override) else shutil.which(override)
+    
+    path = shutil.which("tesseract")
+    if path:
+        return path
+    
+    for candidate in TESSERACT_CANDIDATE_PATHS.get(platform.system(), ()):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
 # Tesseractのパスを自動検出して設定
 def setup_tesseract():
     """Tesseractの実行パスを設定"""
-    system = platform.system()
-    
-    # Windowsの場合
-    if system == "Windows":
-        possible_paths = [
-            r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-            r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-            r"C:\tesseract\tesseract.exe"
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                pytesseract.pytesseract.tesseract_cmd = path
-                logger.info(f"Tesseract found at: {path}")
-                return True
-    
-    # macOSの場合
-    elif system == "Darwin":
-        possible_paths = [
-            "/usr/local/bin/tesseract",
-            "/opt/homebrew/bin/tesseract",
-            "/usr/bin/tesseract"
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                pytesseract.pytesseract.tesseract_cmd = path
-                logger.info(f"Tesseract found at: {path}")
-                return True
-    
-    # Linuxまたはその他の場合、デフォルトパスを試す
-    try:
-        # tesseractコマンドが使えるか確認
-        result = subprocess.run(['tesseract', '--version'], capture_output=True, text=True)
-        if result.returncode == 0:
-            logger.info(f"Tesseract version: {result.stdout.split()[1]}")
-            return True
-    except Exception as e:
-        logger.error(f"Tesseract not found in PATH: {e}")
+    path = find_tesseract()
+    if path is None:
+        logger.error("Tesseract not found in TESSERACT_CMD, PATH or the default install locations")
+        return False
     
-    return False
+    pytesseract.pytesseract.tesseract_cmd = path
+    logger.info("Tesseract found at: %s", path)
+    return True
 
 
 # Tesseractのセットアップ
 tesseract_available = setup_tesseract()
 
+
+@lru_cache(maxsize=None)
+def get_tesseract_languages() -> Optional[Tuple[str, ...]]:
+    """Tesseractで利用可能な言語（プロセスの起動はプロセスごとに初回のみ。取得できなければNone）"""
+    try:
+        langs = tuple(pytesseract.get_languages(config=''))
+    except Exception as e:
+        logger.error("Failed to get Tesseract languages: %s", e)
+        return None
+    logger.info("Available Tesseract languages: %s", langs)
+    return langs
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str) -> OpenAI:
+    """OpenAIクライアント（プロセス内で共有し、HTTP接続プールとTLS接続を使い回す）"""
+    return OpenAI(api_key=api_key)
+
+# 先頭バイト（マジックナンバー）による画像フォーマット判定用テーブル
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+    (b'BM', 'BMP'),
+)
+
+# HEIC/HEIFとして扱うftypブランド
+HEIF_BRANDS = frozenset({b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'hevm', b'hevs', b'mif1', b'msf1'})
+
+# ftypボックスの判定用: 4〜12バイト目を (ボックス種別, ブランド) の32ビット整数2つとして読む
+_FTYP_HEADER = struct.Struct('>II')
+_FTYP = int.from_bytes(b'ftyp', 'big')
+_HEIF_BRAND_CODES = frozenset(int.from_bytes(brand, 'big') for brand in HEIF_BRANDS)
+
+# フォーマット判定に必要な先頭バイト数
+IMAGE_SNIFF_BYTES = 12
+
+# テキストからレシート情報を抽出するプロンプト（毎回組み立てないよう一度だけ作る）
+RECEIPT_PROMPT_TEMPLATE = ChatPromptTemplate.from_template(
+    """
+    以下は日本のレシートのテキストです。このテキストから以下の情報を抽出してください：
+    1. 日付 (YYYY-MM-DD形式、見つからない場合はnull)
+    2. 店名または会社名
+    3. 合計金額 (数値のみ、見つからない場合はnull)
+    4. 税抜き価格 (あれば、数値のみ)
+    5. 税込み価格 (あれば、数値のみ)
+
+    JSONフォーマットで回答してください：
+    {{
+        "date": "YYYY-MM-DD" or null,
+        "store_name": "店名",
+        "total_amount": 数値 or null,
+        "tax_excluded_amount": 数値 or null,
+        "tax_included_amount": 数値 or null
+    }}
+
+    レシートテキスト:
+    {text}
+    """
+)
+
+# Vision API（GPT-4o）でレシート情報を抽出するプロンプト
+VISION_PROMPT = """
+この画像は日本のレシートです。以下の情報を正確に抽出してください：
+
+1. 日付 (YYYY-MM-DD形式、見つからない場合はnull)
+2. 店名または会社名
+3. 合計金額 (数値のみ、見つからない場合はnull)
+4. 税抜き価格 (あれば、数値のみ)
+5. 税込み価格 (あれば、数値のみ)
+
+以下のJSONフォーマットで回答してください：
+{
+    "date": "YYYY-MM-DD" or null,
+    "store_name": "店名",
+    "total_amount": 数値 or null,
+    "tax_excluded_amount": 数値 or null,
+    "tax_included_amount": 数値 or null
+}
+
+注意事項：
+- 日付は必ずYYYY-MM-DD形式に変換してください
+- 金額は数値のみ（カンマや円記号は除く）
+- 税抜き/税込み価格が明記されていない場合はnull
+- 不明な情報はnullとしてください
+"""
+
+# 低解像度（detail: low）で読み取るときにVISION_PROMPTに追加する指示
+VISION_LOW_DETAIL_NOTE = """
+- 画像が粗く数字（特に合計金額）を確実に読み取れない場合は "needs_high_detail": true を追加してください
+"""
+
+# Vision API（商品明細・支払い方法も抽出する）のプロンプト
+VISION_ITEMS_PROMPT = """このレシート画像から以下の情報を抽出してJSON形式で返してください：
+1. 日付 (YYYY-MM-DD形式)
+2. 店名
+3. 合計金額
+4. 税抜き価格（あれば）
+5. 税込み価格（あれば）
+6. 商品明細（商品名と価格のリスト）
+7. 支払い方法
+
+JSONフォーマット:
+{
+    "date": "YYYY-MM-DD",
+    "store_name": "店名",
+    "total_amount": 数値,
+    "tax_excluded_amount": 数値,
+    "tax_included_amount": 数値,
+    "items": [{"name": "商品名", "price": 数値}],
+    "payment_method": "支払い方法"
+}"""
+
+
+class ProcessingMode(str, Enum):
+    """処理モード"""
+    AUTO = "auto"
+    OCR = "ocr"
+    AI = "ai"
+    VISION = "vision"
+
+
+# APIで受け付ける処理モード
+PROCESSING_MODES = frozenset(mode.value for mode in ProcessingMode)
+
+# AI処理に回すOCRテキストの最小文字数（これ未満、または数字を含まない場合はAPIを呼ばない）
+MIN_AI_TEXT_LENGTH = 20
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _worth_ai_processing(ocr_text: str) -> bool:
+    """OCRテキストがAI処理（OpenAI API呼び出し）に回す価値があるか"""
+    if len(ocr_text.strip()) < MIN_AI_TEXT_LENGTH or not _DIGIT_RE.search(ocr_text):
+        logger.debug("Skipping AI processing: OCR text is too short or has no digits")
+        return False
+    return True
+
+# 現在日付（ローカル時刻、YYYY-MM-DD）のキャッシュ: (作成時刻, 日付)
+_today_cache: Tuple[float, str] = (0.0, "")
+
+
+def get_today() -> str:
+    """現在の日付（YYYY-MM-DD、ローカル時刻）を返す（1秒単位でキャッシュ）"""
+    global _today_cache
+    stamp, today = _today_cache
+    now = time.time()
+    if now - stamp >= 1.0:
+        today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+        _today_cache = (now, today)
+    return today
+
+
+# 受け付ける画像フォーマット（PILのformat名）と上限
+ALLOWED_FORMATS = frozenset({'JPEG', 'PNG', 'WEBP', 'BMP', 'TIFF', 'GIF', 'HEIF'})
+MAX_IMAGE_BYTES = 50 * 1024 * 1024
+MAX_IMAGE_DIMENSION = 5000
+
+
+def _jpeg_data_url(image_bytes: bytes) -> str:
+    """JPEG画像をVision APIに渡すbase64のdata URLにする（base64はASCIIなのでasciiでデコード）"""
+    return "data:image/jpeg;base64," + binascii.b2a_base64(image_bytes, newline=False).decode('ascii')
+
+
+def detect_image_format(header: bytes) -> Optional[str]:
+    """先頭バイトから画像フォーマットを判定（画像でなければNone）"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    if len(header) >= 12:
+        # スライスを作らず整数として比較
+        box_type, brand = _FTYP_HEADER.unpack_from(header, 4)
+        if box_type == _FTYP and brand in _HEIF_BRAND_CODES:
+            return 'HEIF'
+    return None
+
+
 class ReceiptProcessor:
     """Secure receipt processing with AI-OCR Vision and fallback OCR functionality."""
     
+    # 処理結果のキャッシュ件数
+    RESULT_CACHE_SIZE = 1024
+    
+    # OCRテキストのキャッシュ件数（画像の内容ハッシュがキー。処理モードを変えた再処理でもOCRをやり直さない）
+    OCR_TEXT_CACHE_SIZE = 256
+    
+    # 一括処理でOCRテキストからの抽出（AI呼び出し）を並列に行うスレッド数
+    BATCH_WORKERS = 4
+    
+    # ハイブリッド処理でAI呼び出しを実行するスレッド数
+    AI_WORKERS = 4
+    
+    # Vision APIに送る画像の長辺の上限（px）とJPEG品質（レシートは文字のみなので十分読める）
+    VISION_MAX_EDGE = 1600
+    VISION_JPEG_QUALITY = 85
+    
+    # Vision APIの解像度（まず安価なlowで試し、店名・合計金額が取れなければhighで再試行）
+    VISION_DETAIL_PASSES = ("low", "high")
+    
+    # Vision APIの応答の最大トークン数（1枚分のJSONは200トークン程度）
+    VISION_MAX_TOKENS = 300
+    
+    # 一括処理で1回のVision APIリクエストにまとめる画像の最大数
+    VISION_BATCH_SIZE = 10
+    
     def __init__(self):
         """Initialize the receipt processor with secure configuration."""
         self.openai_available = settings.openai_available
@@ -100,24 +319,25 @@ class ReceiptProcessor:
 
         
         # OCRプロセッサーの初期化
-        self.ocr_processor = OCRProcessor(cv2_available=self.cv2_available)
+        self.ocr_processor = OCRProcessor(
+            cv2_available=self.cv2_available,
+            use_gpu=settings.use_gpu_ocr,
+            min_line_confidence=settings.ocr_min_line_confidence,
+        )
         
-        # AIプロセッサーの初期化        # 処理モード設定
+        # 画像の内容ハッシュをキーにした処理結果キャッシュ
+        self._result_cache = LRUCache(maxsize=self.RESULT_CACHE_SIZE)
+        self._ocr_text_cache = LRUCache(maxsize=self.OCR_TEXT_CACHE_SIZE)
+        
+        # 処理モード設定
         self.processing_mode = self._determine_processing_mode()
-
-        # Initialize OpenAI client for Vision API
-        if self.vision_api_available:
-            try:
-                self.openai_client = OpenAI(api_key=settings.openai_api_key)
-                logger.info("OpenAI Vision API initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize OpenAI Vision API: {e}")
-                self.vision_api_available = False
         
         if not self.tesseract_available:
             logger.error("Tesseract OCR is not available. Please install Tesseract OCR.")
 
         self.ai_processor = None
+        # ハイブリッド処理でAI呼び出しをOCR解析と並行に実行するためのスレッド
+        self._ai_executor = ThreadPoolExecutor(max_workers=self.AI_WORKERS)
         if self.openai_available:
             try:
                 self.ai_processor = AIProcessor(
@@ -126,17 +346,18 @@ class ReceiptProcessor:
                 )
                 logger.info("AI processor initialized successfully")
             except Exception as e:
-                logger.error(f"Failed to initialize AI processor: {e}")
+                logger.error("Failed to initialize AI processor: %s", e)
                 self.openai_available = False
         
-        # OpenAI Vision API用のクライアント初期化
+        # OpenAI Vision API用のクライアント（プロセス内で共有）
         self.openai_client = None
         if self.openai_available:
             try:
-                self.openai_client = OpenAI(api_key=settings.openai_api_key)
+                self.openai_client = get_openai_client(settings.openai_api_key)
                 logger.info("OpenAI client initialized for Vision API")
             except Exception as e:
-                logger.error(f"Failed to initialize OpenAI client: {e}")
+                logger.error("Failed to initialize OpenAI client: %s", e)
+                self.vision_api_available = False
         
         # Configure Tesseract if custom path is provided
         if settings.tessdata_prefix:
@@ -145,7 +366,19 @@ class ReceiptProcessor:
         # Tesseractの言語データを確認
         self._check_tesseract_languages()
         
-        logger.info(f"Receipt processor initialized - Mode: {self.processing_mode}")
+        # 処理モードごとのOCRテキスト処理（利用可能な機能は初期化後に変わらないため一度だけ決める）
+        self._text_handlers = self._build_text_handlers()
+        
+        # 処理結果に付与する機能情報（初期化後は変わらないため一度だけ作る）
+        self._processing_info_template = {
+            "ocr_available": self.tesseract_available,
+            "ai_available": self.openai_available,
+            "vision_available": bool(self.openai_client),
+            "cv2_available": self.cv2_available,
+            "heif_support": self.heif_available
+        }
+        
+        logger.info("Receipt processor initialized - Mode: %s", self.processing_mode)
     
     def _determine_processing_mode(self) -> str:
         """処理モードを決定"""
@@ -161,76 +394,72 @@ class ReceiptProcessor:
         if not self.tesseract_available:
             return
         
-        try:
-            langs = pytesseract.get_languages(config='')
-            logger.info(f"Available Tesseract languages: {langs}")
-            
-            if 'jpn' not in langs:
-                logger.warning("Japanese language data (jpn) not found in Tesseract.")
-            if 'eng' not in langs:
-                logger.warning("English language data (eng) not found in Tesseract.")
-        except Exception as e:
-            logger.error(f"Failed to get Tesseract languages: {e}")
+        langs = get_tesseract_languages()
+        if langs is None:
+            return
+        
+        if 'jpn' not in langs:
+            logger.warning("Japanese language data (jpn) not found in Tesseract.")
+        if 'eng' not in langs:
+            logger.warning("English language data (eng) not found in Tesseract.")
+    
+    def preload_ocr(self):
+        """OCRエンジン（Tesseract APIハンドル）を事前に初期化"""
+        if self.tesseract_available:
+            self.ocr_processor.preload()
+    
+    def close(self):
+        """OCRエンジンとスレッドプールのリソースを解放"""
+        self._ai_executor.shutdown(wait=False)
+        self.ocr_processor.close()
     
     def _create_prompt_template(self) -> ChatPromptTemplate:
         """Create a secure prompt template for OpenAI."""
-        return ChatPromptTemplate.from_template(
-            """
-            以下は日本のレシートのテキストです。このテキストから以下の情報を抽出してください：
-            1. 日付 (YYYY-MM-DD形式、見つからない場合はnull)
-            2. 店名または会社名
-            3. 合計金額 (数値のみ、見つからない場合はnull)
-            4. 税抜き価格 (あれば、数値のみ)
-            5. 税込み価格 (あれば、数値のみ)
-            
-            JSONフォーマットで回答してください：
-            {{
-                "date": "YYYY-MM-DD" or null,
-                "store_name": "店名",
-                "total_amount": 数値 or null,
-                "tax_excluded_amount": 数値 or null,
-                "tax_included_amount": 数値 or null
-            }}
-            
-            レシートテキスト:
-            {text}
-            """
-        )
+        return RECEIPT_PROMPT_TEMPLATE
     
     def _create_vision_prompt(self) -> str:
         """Create a prompt for Vision API OCR."""
-        return """
-        この画像は日本のレシートです。以下の情報を正確に抽出してください：
-        
-        1. 日付 (YYYY-MM-DD形式、見つからない場合はnull)
-        2. 店名または会社名
-        3. 合計金額 (数値のみ、見つからない場合はnull)
-        4. 税抜き価格 (あれば、数値のみ)
-        5. 税込み価格 (あれば、数値のみ)
-        
-        以下のJSONフォーマットで回答してください：
-        {
-            "date": "YYYY-MM-DD" or null,
-            "store_name": "店名",
-            "total_amount": 数値 or null,
-            "tax_excluded_amount": 数値 or null,
-            "tax_included_amount": 数値 or null
-        }
-        
-        注意事項：
-        - 日付は必ずYYYY-MM-DD形式に変換してください
-        - 金額は数値のみ（カンマや円記号は除く）
-        - 税抜き/税込み価格が明記されていない場合はnull
-        - 不明な情報はnullとしてください
-        """
+        return VISION_PROMPT
     
     def _extract_with_vision_api(self, image_bytes: bytes) -> Dict[str, Any]:
-        """Extract receipt information using GPT-4o Vision API."""
+        """Extract receipt information using GPT-4o Vision API, retrying at high detail if the coarse pass is incomplete."""
+        # Convert image to a base64 data URL once for all passes
+        image_url = _jpeg_data_url(image_bytes)
+        
+        best = None  # the successful result of the most detailed pass so far
+        for detail in self.VISION_DETAIL_PASSES:
+            try:
+                result = self._request_vision_api(image_url, detail)
+            except Exception as e:
+                # API errors (network, auth, quota) are not fixed by a higher detail level, so stop here
+                logger.error("Vision API extraction error: %s", e)
+                result = {
+                    "success": False,
+                    "message": f"Vision API処理中にエラーが発生しました: {str(e)}",
+                    "data": None
+                }
+                break
+            if result["success"]:
+                best = result
+            if self._is_complete_vision_result(result):
+                break
+        
+        # A usable partial result from an earlier pass beats a failed later pass
+        result = best or result
+        result.pop("needs_high_detail", None)
+        return result
+    
+    @staticmethod
+    def _is_complete_vision_result(result: Dict[str, Any]) -> bool:
+        """Whether a Vision API result has a store name and total and the model did not ask for a high-detail read."""
+        data = result["data"]
+        return (result["success"] and bool(data["store_name"]) and data["total_amount"] is not None
+                and not result.get("needs_high_detail"))
+    
+    def _request_vision_api(self, image_url: str, detail: str) -> Dict[str, Any]:
+        """Send one Vision API request at the given detail level and parse the result (API errors propagate)."""
         try:
-            # Convert image to base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            logger.info("Sending image to Vision API for OCR...")
+            logger.info("Sending image to Vision API for OCR (detail: %s)...", detail)
             
             # Call Vision API
             response = self.openai_client.chat.completions.create(
@@ -241,28 +470,44 @@ class ReceiptProcessor:
                         "content": [
                             {
                                 "type": "text",
-                                "text": self._create_vision_prompt()
+                                "text": self._create_vision_prompt() + VISION_LOW_DETAIL_NOTE
+                                if detail == "low" else self._create_vision_prompt()
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"  # Use "high" for better OCR accuracy
+                                    "url": image_url,
+                                    "detail": detail
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=1000,
+                max_tokens=self.VISION_MAX_TOKENS,
                 response_format={"type": "json_object"}  # Ensure JSON response
             )
             
             # Parse the response
             result_text = response.choices[0].message.content
-            logger.info(f"Vision API response: {result_text}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Vision API response: %s", result_text)
             
             # Parse JSON response
-            data = json.loads(result_text)
+            return self._parse_vision_data(orjson.loads(result_text))
+            
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse JSON from Vision API response: %s", e)
+            return {
+                "success": False,
+                "message": "Vision APIのレスポンスが無効でした。",
+                "data": None
+            }
+    
+    def _parse_vision_data(self, data: Any) -> Dict[str, Any]:
+        """Validate one receipt object returned by the Vision API and convert it to a result."""
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("receipt is not a JSON object")
             
             # Validate and process the data
             processed_data = {
@@ -284,55 +529,84 @@ class ReceiptProcessor:
             
             logger.info("Successfully extracted receipt data with Vision API")
             
-            return {
+            result = {
                 "success": True,
                 "message": "AI-OCR (Vision API)でレシート情報を抽出しました。",
                 "data": processed_data
             }
+            # 低解像度では数字を読み取れないとモデルが判断した場合の印（呼び出し側で取り除く）
+            if data.get("needs_high_detail") is True:
+                result["needs_high_detail"] = True
+            return result
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON from Vision API response: {e}")
+        except (TypeError, ValueError) as e:
+            logger.error("Invalid receipt data in Vision API response: %s", e)
             return {
                 "success": False,
                 "message": "Vision APIのレスポンスが無効でした。",
                 "data": None
             }
-        except Exception as e:
-            logger.error(f"Vision API extraction error: {e}")
-            return {
-                "success": False,
-                "message": f"Vision API処理中にエラーが発生しました: {str(e)}",
-                "data": None
-            }
-
-    def _convert_heic_to_jpeg(self, image_bytes: bytes) -> bytes:
-        """Convert HEIC/HEIF image to JPEG format."""
-        if not self.heif_available:
-            raise ValueError("HEIC conversion not available. Please install pyheif.")
+    
+    def _create_vision_batch_prompt(self, count: int) -> str:
+        """Create a prompt asking the Vision API for one JSON object per attached receipt image."""
+        return self._create_vision_prompt() + VISION_LOW_DETAIL_NOTE + f"""
+        {count}枚のレシート画像が添付されています。画像ごとに上記のJSONオブジェクトを作成し、
+        添付された順番どおりに以下の形式で回答してください（要素数は必ず{count}個）：
+        {{
+            "receipts": [ {{...1枚目...}}, {{...2枚目...}} ]
+        }}
+        """
+    
+    def _extract_with_vision_api_batch(self, images: List[bytes]) -> List[Dict[str, Any]]:
+        """Extract several receipts with a single low-detail Vision API request (results in image order)."""
+        def failure(message: str) -> List[Dict[str, Any]]:
+            return [{"success": False, "message": message, "data": None} for _ in images]
+        
+        content = [{"type": "text", "text": self._create_vision_batch_prompt(len(images))}]
+        for image_bytes in images:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": _jpeg_data_url(image_bytes),
+                    "detail": self.VISION_DETAIL_PASSES[0]
+                }
+            })
         
         try:
-            heif_file = pyheif.read(image_bytes)
-            image = Image.frombytes(
-                heif_file.mode, 
-                heif_file.size, 
-                heif_file.data,
-                "raw",
-                heif_file.mode,
-                heif_file.stride,
+            logger.info("Sending %d images to Vision API in one request...", len(images))
+            response = self.openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": content}],
+                max_tokens=self.VISION_MAX_TOKENS * len(images),
+                response_format={"type": "json_object"}
             )
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Save as JPEG
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=95)
-            return output.getvalue()
-            
+            receipts = orjson.loads(response.choices[0].message.content).get("receipts")
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse JSON from Vision API batch response: %s", e)
+            return failure("Vision APIのレスポンスが無効でした。")
         except Exception as e:
-            logger.error(f"HEIC conversion failed: {e}")
-            raise
+            logger.error("Vision API batch extraction error: %s", e)
+            return failure(f"Vision API処理中にエラーが発生しました: {str(e)}")
+        
+        if not isinstance(receipts, list) or len(receipts) != len(images):
+            logger.warning("Vision API batch response does not match the number of images")
+            return failure("Vision APIのレスポンスが無効でした。")
+        return [self._parse_vision_data(data) for data in receipts]
+
+    def _prepare_vision_bytes(self, image: Image.Image) -> bytes:
+        """Vision APIに送るため画像を長辺VISION_MAX_EDGEまで縮小してJPEGにエンコード（HEIC/HEIFもJPEGになる）"""
+        scale = self.VISION_MAX_EDGE / max(image.size)
+        if scale < 1:
+            # 検証時に開いた画像はOCRでも使うため、thumbnail（破壊的）ではなく新しい画像に縮小
+            image = image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                Image.LANCZOS
+            )
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=self.VISION_JPEG_QUALITY)
+        return output.getvalue()
     
     def process_image_with_vision(self, image_bytes: bytes) -> Dict[str, Any]:
         """OpenAI Vision APIを使用して画像を直接処理"""
@@ -344,61 +618,40 @@ class ReceiptProcessor:
             }
         
         try:
-            # 画像をbase64エンコード
-            import base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+            # 画像をbase64のdata URLにエンコード
+            image_url = _jpeg_data_url(image_bytes)
             
             # Vision APIを使用
             response = self.openai_client.chat.completions.create(
-                model="gpt-4-vision-preview",
+                model="gpt-4o",
                 messages=[
                     {
                         "role": "user",
                         "content": [
                             {
                                 "type": "text",
-                                "text": """このレシート画像から以下の情報を抽出してJSON形式で返してください：
-                                1. 日付 (YYYY-MM-DD形式)
-                                2. 店名
-                                3. 合計金額
-                                4. 税抜き価格（あれば）
-                                5. 税込み価格（あれば）
-                                6. 商品明細（商品名と価格のリスト）
-                                7. 支払い方法
-                                
-                                JSONフォーマット:
-                                {
-                                    "date": "YYYY-MM-DD",
-                                    "store_name": "店名",
-                                    "total_amount": 数値,
-                                    "tax_excluded_amount": 数値,
-                                    "tax_included_amount": 数値,
-                                    "items": [{"name": "商品名", "price": 数値}],
-                                    "payment_method": "支払い方法"
-                                }"""
+                                "text": VISION_ITEMS_PROMPT
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": image_url
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=1000
+                max_tokens=1000,
+                response_format={"type": "json_object"}  # JSONのみを返させる
             )
             
-            # レスポンスをパース
-            content = response.choices[0].message.content
-            import json
-            import re
+            # レスポンスをパース（JSONモードなので本文全体がJSON）
+            try:
+                data = orjson.loads(response.choices[0].message.content)
+            except orjson.JSONDecodeError:
+                data = None
             
-            # JSONを抽出
-            json_match = re.search(r'{.*}', content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group(0))
-                
+            if isinstance(data, dict):
                 # データの整形
                 processed_data = {
                     "date": data.get("date"),
@@ -425,7 +678,7 @@ class ReceiptProcessor:
             }
             
         except Exception as e:
-            logger.error(f"Vision API processing error: {e}")
+            logger.error("Vision API processing error: %s", e)
             return {
                 "success": False,
                 "message": f"Vision API処理中にエラーが発生しました: {str(e)}",
@@ -434,50 +687,222 @@ class ReceiptProcessor:
     
     def process_image(self, image_bytes: bytes, processing_mode: Optional[str] = None) -> Dict[str, Any]:
         """
-        レシート画像を処理して情報を抽出
+        レシート画像を処理して情報を抽出（同じ画像・モードの成功結果はキャッシュから返す）
         
         Args:
             image_bytes: 画像データ
             processing_mode: 処理モード ('ai', 'ocr', 'vision', 'auto')
         """
+        cache_key = (content_hash(image_bytes), processing_mode or "auto")
+        cached = self._get_cached_result(cache_key)
+        if cached is not None:
+            logger.info("Returning cached result for identical image")
+            return cached
+        
+        result = self._process_image(image_bytes, processing_mode, image_hash=cache_key[0])
+        self._cache_result(cache_key, result)
+        return result
+    
+    def _get_cached_result(self, cache_key: Tuple[bytes, str]) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みの結果を返す（processing_infoのcache_hitをTrueにする）"""
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            cached["data"].setdefault("processing_info", {})["cache_hit"] = True
+        return cached
+    
+    def _cache_result(self, cache_key: Tuple[bytes, str], result: Dict[str, Any]) -> None:
+        """結果をキャッシュ（一時的なエラーを固定しないよう、成功した結果のみ）"""
+        if result.get("success") and result.get("data"):
+            result["data"].setdefault("processing_info", {})["cache_hit"] = False
+            self._result_cache.set(cache_key, result)
+    
+    def process_images(self, images: List[bytes], processing_mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        複数のレシート画像をまとめて処理
+        
+        OCRは1つのTesseractセッションで一括実行し、OCRテキストからの抽出（AI呼び出しはI/O待ち）は
+        スレッドで並列に行う。GPT-4o Vision APIが使える場合は複数の画像を1回のリクエストにまとめ、
+        それ以外でVision APIを使う場合は画像ごとのprocess_imageをスレッドで並列に実行する。
+        """
+        processing_mode = processing_mode or "auto"
+        
+        if self.vision_api_available:
+            return self._process_images_with_vision_api(images, processing_mode)
+        
+        if processing_mode == "vision" or not self.tesseract_available:
+            with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+                return list(executor.map(self.process_image, images, repeat(processing_mode)))
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+        
+        # キャッシュ済みの画像と無効な画像を除き、残りを開いておく
+        pending = []  # (元の位置, キャッシュキー, 画像)
+        for i, image_bytes in enumerate(images):
+            cache_key = (content_hash(image_bytes), processing_mode)
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            
+            image = self._validate_and_open(image_bytes)
+            if image is None:
+                results[i] = {
+                    "success": False,
+                    "message": "無効な画像ファイルです。",
+                    "data": None
+                }
+                continue
+            pending.append((i, cache_key, image))
+        
+        if pending:
+            # OCRテキストがキャッシュにない画像だけを前処理し、1つのTesseractセッションで一括OCR
+            pending_images = [image for _, _, image in pending]
+            ocr_texts = [self._ocr_text_cache.get(cache_key[0]) for _, cache_key, _ in pending]
+            missing = [j for j, ocr_text in enumerate(ocr_texts) if ocr_text is None]
+            if missing:
+                processed_images = [self.ocr_processor.preprocess_image(pending_images[j]) for j in missing]
+                for j, ocr_text in zip(missing, self.ocr_processor.extract_text_batch(processed_images)):
+                    ocr_texts[j] = ocr_text
+                    self._ocr_text_cache.set(pending[j][1][0], ocr_text)
+                logger.info("Batch OCR extracted text from %d image(s)", len(missing))
+            
+            with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+                extracted = list(executor.map(
+                    self._safe_extract_from_ocr_text, ocr_texts, pending_images, repeat(processing_mode)
+                ))
+            
+            for (i, cache_key, _), result in zip(pending, extracted):
+                self._cache_result(cache_key, result)
+                results[i] = result
+        
+        return results
+    
+    def _process_images_with_vision_api(self, images: List[bytes], processing_mode: str) -> List[Dict[str, Any]]:
+        """
+        Vision APIで複数の画像をまとめて処理
+        
+        VISION_BATCH_SIZE枚ずつ1回のリクエストで抽出し、店名・合計金額が取れなかった（またはhigh detailでの再読が必要な）画像だけを
+        process_image（high detailでの再試行とOCRへのフォールバック）で個別に処理する。
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+        
+        # キャッシュ済みの画像と無効な画像を除き、残りをVision API用に縮小しておく
+        pending = []  # (元の位置, キャッシュキー, Vision API用の画像)
+        for i, image_bytes in enumerate(images):
+            cache_key = (content_hash(image_bytes), processing_mode)
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            
+            image = self._validate_and_open(image_bytes)
+            if image is None:
+                results[i] = {
+                    "success": False,
+                    "message": "無効な画像ファイルです。",
+                    "data": None
+                }
+                continue
+            try:
+                pending.append((i, cache_key, self._prepare_vision_bytes(image)))
+            except Exception as e:
+                logger.error("Vision image preparation failed: %s", e)
+                results[i] = {
+                    "success": False,
+                    "message": "画像の変換に失敗しました。",
+                    "data": None
+                }
+        
+        retry = []  # 個別に処理し直す元の位置
+        for start in range(0, len(pending), self.VISION_BATCH_SIZE):
+            chunk = pending[start:start + self.VISION_BATCH_SIZE]
+            extracted = self._extract_with_vision_api_batch([vision_bytes for _, _, vision_bytes in chunk])
+            for (i, cache_key, _), result in zip(chunk, extracted):
+                if not self._is_complete_vision_result(result):
+                    retry.append(i)
+                    continue
+                result.pop("needs_high_detail", None)
+                # 日付が抽出できなかった場合、現在の日時を使用
+                if not result["data"].get("date"):
+                    result["data"]["date"] = get_today()
+                    result["message"] += " 日付は現在の日付で補完しました。"
+                self._cache_result(cache_key, result)
+                results[i] = result
+        
+        if retry:
+            with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+                retried = executor.map(self.process_image, [images[i] for i in retry], repeat(processing_mode))
+                for i, result in zip(retry, retried):
+                    results[i] = result
+        
+        return results
+    
+    def _safe_extract_from_ocr_text(self, ocr_text: str, image: Image.Image, processing_mode: str) -> Dict[str, Any]:
+        """_extract_from_ocr_textの例外をエラー結果に変換（一括処理で1件の失敗が全体に影響しないように）"""
+        try:
+            return self._extract_from_ocr_text(ocr_text, image, processing_mode)
+        except Exception as e:
+            logger.error("Error processing image: %s", e, exc_info=True)
+            return {
+                "success": False,
+                "message": f"画像処理中にエラーが発生しました: {str(e)}",
+                "data": None
+            }
+    
+    def _process_image(
+        self, image_bytes: bytes, processing_mode: Optional[str] = None, image_hash: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        """レシート画像を処理して情報を抽出（image_hashは画像の内容ハッシュ。OCRテキストのキャッシュに使う）"""
         try:
-            # HEIC変換を試みる
-            if len(image_bytes) >= 12 and image_bytes[4:8] == b'ftyp':
-                logger.info("HEIC format detected, attempting conversion")
+            # 画像検証（HEIC/HEIFはpillow-heifでそのまま開く）
+            image = self._validate_and_open(image_bytes)
+            if image is None:
+                return {
+                    "success": False,
+                    "message": "無効な画像ファイルです。",
+                    "data": None
+                }
+            # 検証時に判定したフォーマットはPILの画像に記録されているので、改めてヘッダを調べない
+            is_heif = image.format == 'HEIF'
+            
+            # Vision APIに送る画像（Vision APIを使うときだけ縮小・JPEG再圧縮する）
+            uses_vision = self.vision_api_available or (
+                self.openai_client and (processing_mode == "vision" or not self.tesseract_available)
+            )
+            if uses_vision:
                 try:
-                    if self.heif_available:
-                        image_bytes = self._convert_heic_to_jpeg(image_bytes)
-                        logger.info("HEIC conversion successful")
-                    else:
-                        logger.warning("HEIC conversion not available")
+                    image_bytes = self._prepare_vision_bytes(image)
                 except Exception as e:
-                    logger.error(f"HEIC conversion failed: {e}")
+                    logger.error("Vision image preparation failed: %s", e)
                     return {
                         "success": False,
-                        "message": "HEIC画像の変換に失敗しました。",
+                        "message": "HEIC画像の変換に失敗しました。" if is_heif else "画像の変換に失敗しました。",
                         "data": None
                     }
             
-            # 画像検証
-            if not self._validate_image(image_bytes):
-                return {
-                    "success": False,
-                    "message": "無効な画像ファイルです。",
-                    "data": None
-                }
-            
             # 処理モードの決定
             if not processing_mode:
                 processing_mode = "auto"
 
+            # OCRにフォールバックするかどうか（visionモードではVision APIで処理し直す）
+            falls_back_to_ocr = self.tesseract_available and not (processing_mode == "vision" and self.openai_client)
+            ocr_text = None
+
             # Try Vision API first if available
             if self.vision_api_available:
                 logger.info("Attempting AI-OCR with Vision API...")
-                result = self._extract_with_vision_api(image_bytes)
+                vision_future = self._ai_executor.submit(self._extract_with_vision_api, image_bytes)
+                # Vision APIの応答を待つ間にフォールバック用のOCRを済ませておく
+                if falls_back_to_ocr:
+                    try:
+                        ocr_text = self._extract_ocr_text(image, image_hash)
+                    except Exception as e:
+                        logger.warning("OCR alongside Vision API failed: %s", e)
+                result = vision_future.result()
                 if result["success"]:
                     # 日付が抽出できなかった場合、現在の日時を使用
                     if result["data"] and not result["data"].get("date"):
-                        result["data"]["date"] = datetime.now().strftime("%Y-%m-%d")
+                        result["data"]["date"] = get_today()
                         result["message"] += " 日付は現在の日付で補完しました。"
                     return result
                 else:
@@ -509,68 +934,88 @@ class ReceiptProcessor:
                         "data": None
                     }
             
-            # 画像を開く
-            image = Image.open(io.BytesIO(image_bytes))
-            logger.info(f"Image opened - size: {image.size}, mode: {image.mode}")
-            
-            # OCRで画像からテキストを抽出
-            processed_image = self.ocr_processor.preprocess_image(image)
-            ocr_text = self.ocr_processor.extract_text(processed_image)
+            # OCRで画像からテキストを抽出（Vision APIと並行して抽出済みならそれを使う）
+            if ocr_text is None:
+                ocr_text = self._extract_ocr_text(image, image_hash)
             
-            logger.info(f"OCR extracted {len(ocr_text)} characters")
-            
-            # 処理モードに基づいて情報を抽出
-            if processing_mode == "ocr" or not self.openai_available:
-                # OCRのみで処理
-                result = self.ocr_processor.process_receipt_text(ocr_text)
-                result["processing_method"] = "ocr"
-            
-            elif processing_mode == "ai" and self.ai_processor:
-                # AIのみで処理
-                result = self.ai_processor.process_text(ocr_text)
-                result["processing_method"] = "ai"
-            
-            else:  # auto mode - AI-OCR ハイブリッド
-                result = self._hybrid_processing(ocr_text, image)
-                result["processing_method"] = "ai-ocr-hybrid"
-            
-            # 日付が抽出できなかった場合、現在の日付を使用
-            if result["success"] and result["data"]:
-                if not result["data"].get("date"):
-                    result["data"]["date"] = datetime.now().strftime("%Y-%m-%d")
-                    result["message"] += " 日付は現在の日付で補完しました。"
-                
-                # 処理メタデータを追加
-                result["data"]["processed_at"] = datetime.utcnow().isoformat()
-                result["data"]["processing_info"] = {
-                    "method": result.get("processing_method", "unknown"),
-                    "ocr_available": self.tesseract_available,
-                    "ai_available": self.openai_available,
-                    "vision_available": bool(self.openai_client),
-                    "cv2_available": self.cv2_available,
-                    "heif_support": self.heif_available
-                }
-            
-            return result
+            return self._extract_from_ocr_text(ocr_text, image, processing_mode)
             
         except Exception as e:
-            logger.error(f"Error processing image: {e}", exc_info=True)
+            logger.error("Error processing image: %s", e, exc_info=True)
             return {
                 "success": False,
                 "message": f"画像処理中にエラーが発生しました: {str(e)}",
                 "data": None
             }
     
+    def _extract_ocr_text(self, image: Image.Image, image_hash: Optional[bytes] = None) -> str:
+        """前処理してOCRで画像からテキストを抽出（検証時に開いた画像をそのまま使う。同じ画像はキャッシュから返す）"""
+        if image_hash is not None:
+            ocr_text = self._ocr_text_cache.get(image_hash)
+            if ocr_text is not None:
+                logger.info("Using cached OCR text for identical image")
+                return ocr_text
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Image opened - size: %s, mode: %s", image.size, image.mode)
+        
+        processed_image = self.ocr_processor.preprocess_image(image)
+        ocr_text = self.ocr_processor.extract_text(processed_image)
+        
+        logger.info("OCR extracted %d characters", len(ocr_text))
+        if image_hash is not None:
+            self._ocr_text_cache.set(image_hash, ocr_text)
+        return ocr_text
+    
+    def _extract_from_ocr_text(self, ocr_text: str, image: Image.Image, processing_mode: str) -> Dict[str, Any]:
+        """OCRテキストから処理モードに応じて情報を抽出し、処理メタデータを付与"""
+        # 処理モードに基づいて情報を抽出（不明なモードはautoとして扱う）
+        handler, method = self._text_handlers.get(processing_mode, self._text_handlers[ProcessingMode.AUTO])
+        result = handler(ocr_text, image)
+        result["processing_method"] = method
+        
+        # 日付が抽出できなかった場合、現在の日付を使用
+        if result["success"] and result["data"]:
+            if not result["data"].get("date"):
+                result["data"]["date"] = get_today()
+                result["message"] += " 日付は現在の日付で補完しました。"
+            
+            # 処理メタデータを追加
+            # datetimeのまま返す（ORJSONResponseがISO形式に直接シリアライズする）
+            result["data"]["processed_at"] = datetime.now(timezone.utc)
+            processing_info = self._processing_info_template.copy()
+            processing_info["method"] = result.get("processing_method", "unknown")
+            result["data"]["processing_info"] = processing_info
+        
+        return result
+    
+    def _build_text_handlers(self) -> Dict[str, Tuple[Callable[[str, Image.Image], Dict[str, Any]], str]]:
+        """処理モード → (OCRテキストの処理関数, 処理方法名) の表（利用可能な機能に応じて初期化時に決める）"""
+        ocr_only = (lambda ocr_text, image: self.ocr_processor.process_receipt_text(ocr_text), "ocr")
+        if not self.openai_available:
+            # OpenAIが使えない場合はどのモードでもOCRのみ
+            return {mode: ocr_only for mode in ProcessingMode}
+        
+        hybrid = (self._hybrid_processing, "ai-ocr-hybrid")
+        ai_only = (lambda ocr_text, image: self.ai_processor.process_text(ocr_text), "ai") if self.ai_processor else hybrid
+        return {
+            ProcessingMode.OCR: ocr_only,
+            ProcessingMode.AI: ai_only,
+            ProcessingMode.VISION: hybrid,
+            ProcessingMode.AUTO: hybrid,
+        }
+    
     def _hybrid_processing(self, ocr_text: str, image: Image.Image) -> Dict[str, Any]:
-        """AI-OCR ハイブリッド処理"""
-        # まずAIで処理を試みる
-        if self.ai_processor and ocr_text.strip():
-            ai_result = self.ai_processor.process_text(ocr_text)
+        """AI-OCR ハイブリッド処理（OCRテキストの解析は1回だけ行い、補完とフォールバックで共用）"""
+        # まずAIで処理を試みる（短すぎる・数字を含まないテキストはAPIを呼ばずOCRのみで処理）
+        if self.ai_processor and _worth_ai_processing(ocr_text):
+            # AI（ネットワーク待ち）とOCRテキストの解析を並行して実行
+            ai_future = self._ai_executor.submit(self.ai_processor.process_text, ocr_text)
+            ocr_result = self.ocr_processor.process_receipt_text(ocr_text)
+            ai_result = ai_future.result()
             
             if ai_result["success"]:
                 # AIが成功した場合、OCRで補完
-                ocr_result = self.ocr_processor.process_receipt_text(ocr_text)
-                
                 if ocr_result["success"] and ocr_result["data"]:
                     # OCRの結果で補完
                     ai_data = ai_result["data"]
@@ -580,73 +1025,65 @@ class ReceiptProcessor:
                     if not ai_data.get("date") and ocr_data.get("date"):
                         ai_data["date"] = ocr_data["date"]
                     
-                    # 金額の検証
-                    if ai_data.get("total_amount") and ocr_data.get("total_amount"):
-                        # 金額が大きく異なる場合は警告
-                        diff_ratio = abs(ai_data["total_amount"] - ocr_data["total_amount"]) / max(ai_data["total_amount"], ocr_data["total_amount"])
-                        if diff_ratio > 0.1:  # 10%以上の差
+                    # 金額の検証（金額が大きく異なる場合は警告）
+                    ai_amount = ai_data.get("total_amount")
+                    ocr_amount = ocr_data.get("total_amount")
+                    if ai_amount and ocr_amount:
+                        larger = ai_amount if ai_amount > ocr_amount else ocr_amount
+                        if abs(ai_amount - ocr_amount) > 0.1 * larger:  # 10%以上の差
                             ai_data["amount_verification_warning"] = True
-                            ai_data["ocr_amount"] = ocr_data["total_amount"]
+                            ai_data["ocr_amount"] = ocr_amount
                     
                     # 信頼度の統合
-                    ai_confidence = ai_data.get("ai_confidence", 0.5)
-                    ocr_confidence = ocr_data.get("ocr_confidence", 0.5)
-                    ai_data["combined_confidence"] = (ai_confidence + ocr_confidence) / 2
+                    ai_data["combined_confidence"] = (
+                        ai_data.get("ai_confidence", 0.5) + ocr_data.get("ocr_confidence", 0.5)
+                    ) / 2
                 
                 return ai_result
+            
+            # AIが失敗した場合はOCRの結果を使う
+            return ocr_result
         
-        # AIが失敗した場合はOCRのみ
+        # AIを使わない場合はOCRのみ
         return self.ocr_processor.process_receipt_text(ocr_text)
     
-    def _validate_image(self, image_bytes: bytes) -> bool:
-        """画像の検証"""
+    def _validate_and_open(self, image_bytes: Union[bytes, mmap.mmap]) -> Optional[Image.Image]:
+        """画像を開いて検証（有効なら開いた画像を返し、無効ならNone）"""
+        # サイズチェック（最も安価なので最初に）
+        if len(image_bytes) > MAX_IMAGE_BYTES:
+            return None
+        
+        # フォーマットチェック（先頭バイトで判定し、PILでは開かない）
+        image_format = detect_image_format(image_bytes[:IMAGE_SNIFF_BYTES])
+        if image_format not in ALLOWED_FORMATS:
+            logger.warning("Unsupported image format: %s", image_format)
+            return None
+        if image_format == 'HEIF' and not self.heif_available:
+            logger.warning("HEIC/HEIF image received but pillow-heif is not available")
+            return None
+        
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # フォーマットチェック
-            allowed_formats = ['JPEG', 'PNG', 'WEBP', 'BMP', 'TIFF', 'GIF']
-            if image.format and image.format not in allowed_formats:
-                logger.warning(f"Unsupported image format: {image.format}")
-                return False
-            
-            # サイズチェック
-            if len(image_bytes) > 50 * 1024 * 1024:
-                return False
+            # Image.openはヘッダのみ読み込む（画素のデコードはOCRで必要になった時点で一度だけ行われる）
+            # 判定済みのフォーマットのプラグインだけを試す
+            # mmapはそのままファイルとして開き、バイト列はBytesIOで包む（どちらも内容をコピーしない）
+            fp = image_bytes if isinstance(image_bytes, mmap.mmap) else io.BytesIO(image_bytes)
+            image = Image.open(fp, formats=[image_format])
             
-            # 寸法チェック
+            # 寸法チェック（ヘッダの値で判定し、大きすぎる画像は画素を展開する前に弾く）
             width, height = image.size
-            if width > 5000 or height > 5000:
-                return False
+            if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+                image.close()
+                return None
             
-            return True
+            return image
             
         except Exception as e:
-            logger.error(f"Image validation error: {e}")
-            return False
+            logger.error("Image validation error: %s", e)
+            return None
     
     def _suggest_category(self, data: Dict[str, Any]) -> Optional[str]:
         """店名や商品情報から費目カテゴリーを提案"""
-        store_name = data.get("store_name", "").lower()
-        
-        # カテゴリー判定ルール
-        categories = {
-            "食費": ["スーパー", "コンビニ", "ファミリーマート", "セブンイレブン", "ローソン", 
-                   "イオン", "マルエツ", "レストラン", "食堂", "カフェ"],
-            "交通費": ["jr", "駅", "バス", "タクシー", "suica", "pasmo", "交通"],
-            "日用品": ["ドラッグストア", "薬局", "ダイソー", "100均", "ホームセンター"],
-            "書籍": ["書店", "本屋", "ブックオフ", "紀伊國屋"],
-            "娯楽費": ["映画", "カラオケ", "ゲーム", "アミューズメント"],
-            "医療費": ["病院", "クリニック", "薬局", "調剤"],
-            "光熱費": ["電気", "ガス", "水道", "電力", "東京電力", "東京ガス"],
-            "通信費": ["ドコモ", "au", "ソフトバンク", "携帯", "インターネット"],
-        }
-        
-        for category, keywords in categories.items():
-            for keyword in keywords:
-                if keyword in store_name:
-                    return category
-        
-        return None
+        return match_expense_category(data.get("store_name", ""))
     
     def get_processing_capabilities(self) -> Dict[str, Any]:
         """現在の処理能力を返す"""
@@ -689,3 +1126,37 @@ class ReceiptProcessor:
         elif "ocr" in available_modes:
             return "ocr"
         return "unavailable"
+
+
+# プロセスプールのワーカーごとのプロセッサー
+_worker_processor: Optional[ReceiptProcessor] = None
+
+
+def init_worker():
+    """プロセスプールのワーカー初期化（ワーカーごとにReceiptProcessorを生成し、Tesseractを読み込んでおく）"""
+    global _worker_processor
+    _worker_processor = ReceiptProcessor()
+    _worker_processor.preload_ocr()
+
+
+def get_capabilities_in_worker() -> Dict[str, Any]:
+    """ワーカープロセスのプロセッサーの処理能力を返す（APIプロセスではプロセッサーを持たない）"""
+    return _worker_processor.get_processing_capabilities()
+
+
+def process_image_in_worker(image: Union[bytes, str], processing_mode: Optional[str] = None) -> Dict[str, Any]:
+    """ワーカープロセスで画像を処理（パスが渡された場合はmmapで読み込む）"""
+    if isinstance(image, str):
+        with open(image, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _worker_processor.process_image(mm, processing_mode=processing_mode)
+    return _worker_processor.process_image(image, processing_mode=processing_mode)
+
+
+def process_images_in_worker(paths: List[str], processing_mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """ワーカープロセスで複数の画像をまとめて処理（各ファイルをmmapで読み込む）"""
+    with ExitStack() as stack:
+        images = []
+        for path in paths:
+            f = stack.enter_context(open(path, 'rb'))
+            images.append(stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
+        return _worker_processor.process_images(images, processing_mode=processing_mode)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+基本前処理（OpenCVなし）の所要時間計測スクリプト
+縮小→フィルタ（現在の_preprocess_basic）と、フィルタ→縮小（以前の順序）を比較する
+使い方: python bench_preprocess.py [画像ファイルパス（空文字でダミー画像）] [繰り返し回数]
+"""
+
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.ocr_processor import OCRProcessor
+
+
+def preprocess_filter_then_resize(processor, image):
+    """以前の順序: 原寸でコントラスト（LUT）・シャープネス（3x3カーネル）を掛けてから縮小"""
+    image = image.convert('L')
+    histogram = image.histogram()
+    mean = int(sum(i * count for i, count in enumerate(histogram)) / max(sum(histogram), 1) + 0.5)
+    image = image.point([min(255, max(0, int(mean + (v - mean) * 2.0))) for v in range(256)])
+    image = image.filter(processor._SHARPEN_KERNEL)
+    new_size = processor._limited_size(image.size)
+    if new_size != image.size:
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    return image
+
+
+def measure(func, image, repeat):
+    """ウォームアップ1回の後、repeat回の平均時間（ms）"""
+    func(image)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(image)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1]:
+        image = Image.open(sys.argv[1])
+        image.load()
+    else:
+        # 12MP（4000x3000）相当のダミー画像
+        pixels = np.random.default_rng(0).integers(0, 256, (4000, 3000, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels, 'RGB')
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    processor = OCRProcessor(cv2_available=False)
+    print(f"Image: {image.size[0]}x{image.size[1]} {image.mode}, {repeat} runs")
+    before = measure(lambda im: preprocess_filter_then_resize(processor, im), image, repeat)
+    after = measure(processor._preprocess_basic, image, repeat)
+    print(f"filter then resize: {before:.1f} ms")
+    print(f"resize then filter: {after:.1f} ms ({before / after:.2f}x)")
+    processor.close()
+
+
+if __name__ == "__main__":
+    main()
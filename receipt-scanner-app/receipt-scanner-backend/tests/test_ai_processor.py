@@ -0,0 +1,50 @@
+"""
+AI処理モジュールの補助関数のテスト（OpenAI APIは呼び出さない）
+"""
+
+import pytest
+
+from app import ai_processor
+from app.ai_processor import EXPENSE_CATEGORY_KEYWORDS, _slice_json_object, match_expense_category
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("セブンイレブン 新宿駅前店", "食費"),
+    # 複数のカテゴリーにあるキーワードは先に書いたカテゴリーを優先
+    ("調剤薬局", "日用品"),
+    ("タクシー", "交通費"),
+    # 英字のキーワードは大文字小文字を区別しない
+    ("AU ショップ", "通信費"),
+    ("謎の店", None),
+])
+def test_match_expense_category(text, expected):
+    assert match_expense_category(text) == expected
+
+
+def test_match_expense_category_uses_the_highest_priority_category_of_each_keyword():
+    # 薬局は日用品と医療費の両方にあるキーワード
+    assert match_expense_category("薬局") == "日用品"
+    for keyword in {keyword for keywords in EXPENSE_CATEGORY_KEYWORDS.values() for keyword in keywords}:
+        expected = next(category for category, keywords in EXPENSE_CATEGORY_KEYWORDS.items() if keyword in keywords)
+        assert match_expense_category(keyword) == expected, keyword
+
+
+def test_match_expense_category_prefers_priority_for_keywords_at_the_same_position(monkeypatch):
+    # 同じ位置から始まる別カテゴリーのキーワード（「東京」が「東京ガス」の先頭と重なる）
+    # （辞書の並びは優先度の低い順にしておく）
+    ranks = {"東京": (1, "交通費"), "東京ガス": (0, "光熱費")}
+    monkeypatch.setattr(ai_processor, "_CATEGORY_RANKS", ranks)
+    monkeypatch.setattr(ai_processor, "_CATEGORY_KEYWORD_RE", ai_processor._compile_category_keywords(ranks))
+    assert match_expense_category("東京ガス株式会社") == "光熱費"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('結果: {"a": {"b": 1}} 以上 {"c": 2}', '{"a": {"b": 1}}'),
+    # 文字列中の括弧とエスケープされた引用符は数えない
+    ('{"a": "}{"}', '{"a": "}{"}'),
+    ('{"a": "\\"}"}', '{"a": "\\"}"}'),
+    ("JSONなし", None),
+    ('{"a": 1', None),
+])
+def test_slice_json_object(text, expected):
+    assert _slice_json_object(text) == expected
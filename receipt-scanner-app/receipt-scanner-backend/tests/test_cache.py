@@ -0,0 +1,47 @@
+"""
+処理結果キャッシュのテスト
+"""
+
+import mmap
+
+from app.cache import LRUCache, content_hash
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a"を最近使ったものにする
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_overwrites_existing_key():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("a", 2)
+    cache.set("b", 3)
+    assert cache.get("a") == 2
+    assert cache.get("b") == 3
+
+
+def test_lru_cache_copies_values_in_and_out():
+    cache = LRUCache()
+    value = {"data": {"items": [1]}}
+    cache.set("key", value)
+    value["data"]["items"].append(2)
+    cached = cache.get("key")
+    assert cached == {"data": {"items": [1]}}
+    cached["data"]["items"].append(3)
+    assert cache.get("key") == {"data": {"items": [1]}}
+
+
+def test_content_hash_is_the_same_for_bytes_memoryview_and_mmap():
+    data = b"receipt image bytes"
+    with mmap.mmap(-1, len(data)) as mm:
+        mm.write(data)
+        assert content_hash(data) == content_hash(memoryview(data)) == content_hash(mm)
+    assert len(content_hash(data)) == 16
+    assert content_hash(data) != content_hash(data + b"!")
@@ -0,0 +1,25 @@
+"""
+Settingsのテスト（環境変数からの読み込み）
+"""
+
+import pytest
+
+from app.config import Settings
+
+
+@pytest.mark.parametrize("workers, use_gpu, expected", [
+    ("3", "false", 3),
+    ("3", "true", 1),
+    ("1", "true", 1),
+])
+def test_process_pool_workers(monkeypatch, workers, use_gpu, expected):
+    monkeypatch.setenv("PROCESS_POOL_WORKERS", workers)
+    monkeypatch.setenv("USE_GPU_OCR", use_gpu)
+    assert Settings().process_pool_workers == expected
+
+
+def test_process_pool_workers_defaults_to_cpu_count(monkeypatch):
+    monkeypatch.delenv("PROCESS_POOL_WORKERS", raising=False)
+    monkeypatch.delenv("USE_GPU_OCR", raising=False)
+    monkeypatch.setattr("os.cpu_count", lambda: 6)
+    assert Settings().process_pool_workers == 6
@@ -0,0 +1,146 @@
+"""
+APIエンドポイントのテスト（画像処理のワーカーとDB保存は差し替える）
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import main
+from app.auth import get_current_active_user_optional
+from app.database import get_db
+
+
+def _png_bytes(color):
+    output = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    # 起動イベントは実行しない（ワーカープロセスを起動しない）
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "process_pool", pool)
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "rate_limit_storage", {})
+    main.app.dependency_overrides[get_db] = lambda: None
+    main.app.dependency_overrides[get_current_active_user_optional] = lambda: None
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+    pool.shutdown()
+
+
+def test_batch_upload_keeps_upload_order(client, monkeypatch, tmp_path):
+    batches = []
+    saved = []
+
+    def process_images(paths, processing_mode):
+        batches.append((paths, processing_mode))
+        return [
+            {"success": True, "message": "", "data": {"store_name": "A", "total_amount": 100.0}},
+            {"success": False, "message": "読み取れませんでした。", "data": None},
+        ]
+
+    def save_receipt(db, result, filename, tmp_path, processing_mode, current_user):
+        saved.append(filename)
+
+    monkeypatch.setattr(main.settings, "process_pool_workers", 1)
+    monkeypatch.setattr(main, "process_images_in_worker", process_images)
+    monkeypatch.setattr(main, "_save_receipt", save_receipt)
+    files = [
+        ("files", ("a.png", _png_bytes("white"), "image/png")),
+        ("files", ("notes.txt", b"not an image at all", "text/plain")),
+        ("files", ("b.png", _png_bytes("black"), "image/png")),
+    ]
+    response = client.post("/api/receipts/batch", files=files, params={"processing_mode": "ocr"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert [result["success"] for result in body["results"]] == [True, False, False]
+    assert "画像ファイルとして認識できません" in body["results"][1]["message"]
+    assert body["results"][2]["message"] == "読み取れませんでした。"
+    # 画像だけが1回の呼び出しでワーカーに渡され、保存されなかった一時ファイルは残らない
+    assert len(batches) == 1 and len(batches[0][0]) == 2 and batches[0][1] == "ocr"
+    assert saved == ["a.png"]
+    assert list(tmp_path.iterdir()) == []
+
+
+class _FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_batch_upload_splits_work_across_workers_and_isolates_save_errors(client, monkeypatch, tmp_path):
+    batches = []
+    saved = []
+    session = _FakeSession()
+
+    def process_images(paths, processing_mode):
+        batches.append(len(paths))
+        return [{"success": True, "message": "", "data": {"store_name": path}} for path in paths]
+
+    def save_receipt(db, result, filename, tmp_path, processing_mode, current_user):
+        if filename == "2.png":
+            raise RuntimeError("insert failed")
+        saved.append(filename)
+
+    monkeypatch.setattr(main.settings, "process_pool_workers", 2)
+    monkeypatch.setattr(main, "process_images_in_worker", process_images)
+    monkeypatch.setattr(main, "_save_receipt", save_receipt)
+    main.app.dependency_overrides[get_db] = lambda: session
+    files = [("files", (f"{i}.png", _png_bytes((i * 40, 0, 0)), "image/png")) for i in range(5)]
+    response = client.post("/api/receipts/batch", files=files)
+
+    assert response.status_code == 200
+    body = response.json()
+    # 5枚を2つのワーカーに3枚・2枚で分け、保存に失敗した1件だけを失敗として返す
+    assert sorted(batches) == [2, 3]
+    assert [result["success"] for result in body["results"]] == [True, True, False, True, True]
+    assert "保存中にエラー" in body["results"][2]["message"]
+    assert saved == ["0.png", "1.png", "3.png", "4.png"]
+    assert session.rollbacks == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_upload_rejects_too_many_files(client):
+    files = [("files", (f"{i}.png", _png_bytes("white"), "image/png")) for i in range(main.MAX_BATCH_FILES + 1)]
+    response = client.post("/api/receipts/batch", files=files)
+    assert response.status_code == 400
+
+
+def test_batch_upload_rejects_unknown_processing_mode(client):
+    files = [("files", ("a.png", _png_bytes("white"), "image/png"))]
+    response = client.post("/api/receipts/batch", files=files, params={"processing_mode": "magic"})
+    assert response.status_code == 400
+
+
+def test_capabilities_are_fetched_from_a_worker_once_at_startup(monkeypatch):
+    calls = []
+    capabilities = {
+        "processing_mode": "ocr-only",
+        "capabilities": {"ocr": True, "ai": False, "vision": False,
+                         "advanced_image_processing": True, "heic_support": False},
+        "available_modes": ["ocr"],
+        "recommended_mode": "ocr",
+    }
+
+    def get_capabilities():
+        calls.append(1)
+        return capabilities
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "process_pool", pool)
+    monkeypatch.setattr(main, "get_capabilities_in_worker", get_capabilities)
+    monkeypatch.setattr(main, "processing_capabilities", {})
+    with TestClient(main.app) as client:
+        assert client.get("/api/capabilities").json() == capabilities
+        assert client.get("/").json()["processing_capabilities"] == capabilities
+    assert calls == [1]
@@ -0,0 +1,156 @@
+"""
+OCRProcessorのテキスト抽出・前処理のテスト
+"""
+
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance
+
+from app import ocr_processor
+from app.ocr_processor import OCRProcessor
+
+
+@pytest.fixture(scope="module")
+def processor():
+    processor = OCRProcessor(cv2_available=False)
+    yield processor
+    processor.close()
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 合計系のパターンはテキスト中の位置ではなくパターンの優先順で選ぶ
+    ("TOTAL 500\n合計 1,000", 1000.0),
+    ("合計 1,000\nTOTAL 500", 1000.0),
+    ("Total 700\n合 計 800\n", 800.0),
+    # 同じパターンの中では先に現れた一致
+    ("合計 100\n" + "item\n" * 20 + "合計 2,000\n", 100.0),
+    ("TOTAL 500\nTotal 700", 500.0),
+    ("total 42", 42.0),
+    # 範囲外の金額は飛ばして次の一致を使う
+    ("合計 0\n合計 ５００", 500.0),
+])
+def test_extract_amount_total_priority(processor, text, expected):
+    assert processor.extract_amount(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # パターン同士で一致が重なる場合も、パターンごとの一致から最大値を選ぶ
+    ("コーヒー 12345円\n", 12345.0),
+    ("りんご 120円\nみかん 15000円\n計 15120円", 15120.0),
+    ("¥1,980\nお預り 2,000\nお釣り 20", 2000.0),
+    ("1 234 567", 1234567.0),
+    ("no amount here", None),
+])
+def test_extract_amount_without_total(processor, text, expected):
+    assert processor.extract_amount(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2024/01/15 12:30", "2024-01-15"),
+    ("2024年1月5日", "2024-01-05"),
+    ("2024.12.31", "2024-12-31"),
+    ("24/03/01", "2024-03-01"),
+    ("令和6年3月1日", "2024-03-01"),
+    # 存在しない日付は採用しない
+    ("2024-02-30", None),
+    ("日付なし", None),
+])
+def test_extract_date(processor, text, expected):
+    assert processor.extract_date(text) == expected
+
+
+def test_extract_items_keeps_matches_of_each_pattern(processor):
+    # 価格の後に「円」がある行は両方の商品パターンに一致する
+    assert processor.extract_items("りんご 120円\nみかん 150円") == [
+        {"name": "りんご", "price": 120.0},
+        {"name": "みかん", "price": 150.0},
+        {"name": "りんご", "price": 120.0},
+        {"name": "みかん", "price": 150.0},
+    ]
+
+
+def test_extract_tax_amounts(processor):
+    assert processor.extract_tax_amounts("税抜 1,000\n消費税 100\n税込 1,100") == (1000.0, 1100.0)
+    assert processor.extract_tax_amounts("合計 500") == (None, None)
+
+
+def test_extract_tax_amounts_uses_last_match_of_each_kind(processor):
+    # 1つにまとめた正規表現でも、種類ごとに最後の一致を使い、内税・消費税は税抜/税込に数えない
+    text = "税別 500\n税込 540\n税抜 1,000\n内税 80\n税込 1,080\n消費税 80"
+    assert processor.extract_tax_amounts(text) == (1000.0, 1080.0)
+    assert processor.extract_tax_amounts("税抜：￥２，０００") == (2000.0, None)
+
+
+def test_extract_items_keeps_fullwidth_commas_in_names(processor):
+    assert processor.extract_items("お茶，大 1，200") == [{"name": "お茶，大", "price": 1200.0}]
+
+
+def test_process_receipt_text_rejects_text_without_digits(processor):
+    result = processor.process_receipt_text("テストストア\nありがとうございました")
+    assert result["success"] is False
+
+
+def test_process_receipt_text_finds_digits_after_long_header(processor):
+    header = "ごあいさつ" * 120
+    result = processor.process_receipt_text(f"テストストア\n{header}\n合計 1,000")
+    assert result["success"] is True
+    assert result["data"]["total_amount"] == 1000.0
+
+
+def _tesseract_data(lines):
+    """(テキスト, 信頼度) の行リストからimage_to_data（Output.DICT）形式の結果を作る"""
+    data = {key: [] for key in ("page_num", "block_num", "par_num", "line_num", "text", "conf")}
+    for line_num, (text, conf) in enumerate(lines, start=1):
+        for word in text.split():
+            data["page_num"].append(1)
+            data["block_num"].append(1)
+            data["par_num"].append(1)
+            data["line_num"].append(line_num)
+            data["text"].append(word)
+            data["conf"].append(conf)
+    return data
+
+
+@pytest.fixture
+def tesseract_output(monkeypatch):
+    """pytesseractの出力を差し替える（tesserocrは使わない）"""
+    monkeypatch.setattr(ocr_processor, "TESSEROCR_AVAILABLE", False)
+    
+    def install(lines):
+        monkeypatch.setattr(ocr_processor.pytesseract, "image_to_data", lambda *args, **kwargs: _tesseract_data(lines))
+        monkeypatch.setattr(
+            ocr_processor.pytesseract, "image_to_string", lambda *args, **kwargs: "\n".join(text for text, _ in lines)
+        )
+    return install
+
+
+def _ocr(processor, tesseract_output, lines):
+    tesseract_output(lines)
+    return processor._ocr_with_config(Image.new("L", (10, 10)), "jpn+eng", 3, 6)
+
+
+def test_low_confidence_lines_are_kept_by_default(processor, tesseract_output):
+    assert _ocr(processor, tesseract_output, [("テストストア", "90"), ("@@ ##", "10")]) == "テストストア\n@@ ##"
+
+
+def test_low_confidence_lines_are_dropped_when_configured(tesseract_output):
+    processor = OCRProcessor(cv2_available=False, min_line_confidence=40)
+    lines = [("テストストア", "90"), ("@@ ##", "10"), ("合計 1,000", "85")]
+    assert _ocr(processor, tesseract_output, lines) == "テストストア\n合計 1,000"
+    processor.close()
+
+
+def test_faint_total_line_keeps_all_lines(tesseract_output):
+    processor = OCRProcessor(cv2_available=False, min_line_confidence=40)
+    lines = [("りんご 120円", "90"), ("合計 1,000", "20")]
+    assert _ocr(processor, tesseract_output, lines) == "りんご 120円\n合計 1,000"
+    processor.close()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_preprocess_basic_matches_image_enhance(processor, mode):
+    # LUTと畳み込み1回の実装はImageEnhance.Contrast(2.0)→Sharpness(2.0)と画素単位で一致する
+    pixels = np.random.default_rng(0).integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels, "RGB").convert(mode)
+    expected = ImageEnhance.Sharpness(ImageEnhance.Contrast(image.convert("L")).enhance(2.0)).enhance(2.0)
+    assert np.array_equal(np.asarray(processor._preprocess_basic(image)), np.asarray(expected))
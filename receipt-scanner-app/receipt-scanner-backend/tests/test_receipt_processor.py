@@ -0,0 +1,198 @@
+"""
+ReceiptProcessorのテスト（OpenAI APIは呼び出さない）
+"""
+
+import io
+import mmap
+
+import pytest
+from PIL import Image
+
+from app.cache import LRUCache
+from app.receipt_processor import ReceiptProcessor, detect_image_format
+
+
+@pytest.fixture(scope="module")
+def processor():
+    processor = ReceiptProcessor()
+    yield processor
+    processor.close()
+
+
+def _vision_result(store_name="テストストア", total_amount=1000.0, **extra):
+    return {
+        "success": True,
+        "message": "",
+        "data": {"date": None, "store_name": store_name, "total_amount": total_amount},
+        **extra,
+    }
+
+
+@pytest.mark.parametrize("result, complete", [
+    (_vision_result(), True),
+    (_vision_result(store_name=None), False),
+    (_vision_result(total_amount=None), False),
+    (_vision_result(needs_high_detail=True), False),
+    ({"success": False, "message": "", "data": None}, False),
+])
+def test_is_complete_vision_result(result, complete):
+    assert ReceiptProcessor._is_complete_vision_result(result) is complete
+
+
+def test_vision_low_detail_pass_escalates_when_incomplete(processor, monkeypatch):
+    passes = []
+    
+    def request(image_url, detail):
+        passes.append(detail)
+        return _vision_result(total_amount=None) if detail == "low" else _vision_result()
+    
+    monkeypatch.setattr(processor, "_request_vision_api", request)
+    result = processor._extract_with_vision_api(b"\xff\xd8\xff")
+    assert passes == ["low", "high"]
+    assert result["data"]["total_amount"] == 1000.0
+
+
+def test_vision_low_detail_pass_is_enough_when_complete(processor, monkeypatch):
+    passes = []
+    
+    def request(image_url, detail):
+        passes.append(detail)
+        return _vision_result(needs_high_detail=False)
+    
+    monkeypatch.setattr(processor, "_request_vision_api", request)
+    result = processor._extract_with_vision_api(b"\xff\xd8\xff")
+    assert passes == ["low"]
+    assert "needs_high_detail" not in result
+
+
+class _FakeAIProcessor:
+    def __init__(self, success):
+        self.success = success
+    
+    def process_text(self, ocr_text):
+        if not self.success:
+            return {"success": False, "message": "", "data": None}
+        return _vision_result(total_amount=1080.0, ai_confidence=0.9)
+
+
+@pytest.mark.parametrize("ai_success", [True, False])
+def test_hybrid_processing_parses_ocr_text_once(processor, monkeypatch, ai_success):
+    calls = []
+    parse = processor.ocr_processor.process_receipt_text
+    
+    def counting_parse(ocr_text):
+        calls.append(ocr_text)
+        return parse(ocr_text)
+    
+    monkeypatch.setattr(processor, "ai_processor", _FakeAIProcessor(ai_success))
+    monkeypatch.setattr(processor.ocr_processor, "process_receipt_text", counting_parse)
+    ocr_text = "テストストア\n2024/01/15\nコーヒー 500円\n合計 1,080円\n"
+    result = processor._hybrid_processing(ocr_text, None)
+    assert len(calls) == 1
+    assert result["data"]["total_amount"] == 1080.0
+
+
+def test_vision_keeps_low_detail_result_when_high_detail_pass_fails(processor, monkeypatch):
+    def request(image_url, detail):
+        if detail == "low":
+            return _vision_result(total_amount=None, needs_high_detail=True)
+        raise ConnectionError("network down")
+    
+    monkeypatch.setattr(processor, "_request_vision_api", request)
+    result = processor._extract_with_vision_api(b"\xff\xd8\xff")
+    assert result["success"] is True
+    assert result["data"]["store_name"] == "テストストア"
+    assert "needs_high_detail" not in result
+
+
+def test_vision_keeps_low_detail_result_when_high_detail_result_is_invalid(processor, monkeypatch):
+    def request(image_url, detail):
+        if detail == "low":
+            return _vision_result(total_amount=None)
+        return {"success": False, "message": "Vision APIのレスポンスが無効でした。", "data": None}
+    
+    monkeypatch.setattr(processor, "_request_vision_api", request)
+    assert processor._extract_with_vision_api(b"\xff\xd8\xff")["success"] is True
+
+
+def test_vision_does_not_escalate_after_an_api_error(processor, monkeypatch):
+    passes = []
+    
+    def request(image_url, detail):
+        passes.append(detail)
+        raise PermissionError("invalid api key")
+    
+    monkeypatch.setattr(processor, "_request_vision_api", request)
+    result = processor._extract_with_vision_api(b"\xff\xd8\xff")
+    assert passes == ["low"]
+    assert result["success"] is False
+    assert "invalid api key" in result["message"]
+
+
+@pytest.mark.parametrize("header, expected", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\x0d", "PNG"),
+    (b"GIF89a\x01\x00\x01\x00\x00\x00", "GIF"),
+    (b"II*\x00\x08\x00\x00\x00\x00\x00\x00\x00", "TIFF"),
+    (b"BM\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00", "BMP"),
+    (b"RIFF\x00\x00\x00\x00WEBP", "WEBP"),
+    (b"\x00\x00\x00\x18ftypheic", "HEIF"),
+    (b"\x00\x00\x00\x18ftypmif1", "HEIF"),
+    # HEIF以外のftypブランド（MP4など）は画像として扱わない
+    (b"\x00\x00\x00\x18ftypisom", None),
+    (b"%PDF-1.7\n\x00\x00\x00\x00", None),
+    (b"", None),
+])
+def test_detect_image_format(header, expected):
+    assert detect_image_format(header) == expected
+
+
+def _png_bytes(color):
+    output = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_vision_batch_splits_requests_and_retries_incomplete_results(processor, monkeypatch):
+    batches = []
+    retried = []
+    
+    def extract_batch(images):
+        batches.append(len(images))
+        results = [_vision_result() for _ in images]
+        if len(batches) == 2:
+            # 2回目のリクエストの先頭（4枚目の画像）は合計金額が読めなかった
+            results[0] = _vision_result(total_amount=None)
+        return results
+    
+    def process_image(image_bytes, processing_mode=None):
+        retried.append(image_bytes)
+        return _vision_result(store_name="再処理")
+    
+    monkeypatch.setattr(processor, "VISION_BATCH_SIZE", 3)
+    monkeypatch.setattr(processor, "_result_cache", LRUCache())
+    monkeypatch.setattr(processor, "_extract_with_vision_api_batch", extract_batch)
+    monkeypatch.setattr(processor, "process_image", process_image)
+    images = [_png_bytes((i * 40, 0, 0)) for i in range(5)]
+    images.insert(2, b"not an image")
+    
+    results = processor._process_images_with_vision_api(images, "auto")
+    
+    # 無効な画像を除く5枚を3枚ずつのリクエストに分け、不完全な結果だけを個別に処理し直す
+    assert batches == [3, 2]
+    assert retried == [images[4]]
+    assert [result["success"] for result in results] == [True, True, False, True, True, True]
+    assert results[4]["data"]["store_name"] == "再処理"
+    assert all(results[i]["data"]["store_name"] == "テストストア" for i in (0, 1, 3, 5))
+
+
+def test_validate_and_open_reads_an_mmap_in_place(processor, tmp_path):
+    path = tmp_path / "receipt.png"
+    path.write_bytes(_png_bytes("white"))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        image = processor._validate_and_open(mm)
+        assert image.fp is mm
+        assert image.size == (8, 8)
+        image.load()
+        # 同じmmapを開き直しても先頭から読める
+        assert processor._validate_and_open(mm).size == (8, 8)